@@ -0,0 +1,99 @@
+"""
+Measures the cost of calling an overloaded function when the resolution is cached.
+
+Compares the generated call path to the general-purpose `dispatch()` path
+and to calling the implementation directly, as well as to a specialization
+created in advance for the argument types. Calls with keyword arguments are
+measured separately, along with the cost of reordering the keywords into
+positional arguments, which a cached binding of the keywords would add.
+For methods, compares the function installed on the class to binding the
+dispatcher on every attribute access.
+
+Usage: python benchmarks/bench_dispatch.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import overloading
+from overloading import overloaded, overloads
+
+
+NUMBER = 200000
+REPEAT = 5
+
+
+@overloaded
+def f(x: int, y: str):
+    return x
+
+@overloads(f)
+def f(x: str, y: int):
+    return y
+
+@overloads(f)
+def f(x, y, z):
+    return z
+
+def impl(x: int, y: str):
+    return x
+
+
+class C:
+
+    @overloaded
+    def m(self, x: int, y: str):
+        return x
+
+    @overloads(m)
+    def m(self, x: str, y: int):
+        return y
+
+class D:
+    pass
+
+D.m = overloading.unwrap(C.m)   # Assigned after class creation: bound on each access
+
+
+def measure(stmt):
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e9
+
+
+def main():
+    args = (1, 'a')
+    results = [
+        ('direct call', measure(lambda: impl(*args))),
+        ('generic dispatch()', measure(lambda: overloading.dispatch(f, args, {}))),
+        ('generated call path', measure(lambda: f(*args))),
+    ]
+    specialization = f.specialize(int, str)
+    results.append(('specialize(int, str)', measure(lambda: specialization(*args))))
+    kwargs = {'y': 'a'}
+    order = ('y',)
+    reordered = lambda: impl(*((1,) + tuple(map(kwargs.__getitem__, order))))
+    keywords = [
+        ('direct call', measure(lambda: impl(1, **kwargs))),
+        ('reordered direct call', measure(reordered)),
+        ('generic dispatch()', measure(lambda: overloading.dispatch(f, (1,), kwargs))),
+        ('generated call path', measure(lambda: f(1, **kwargs))),
+    ]
+    c, d = C(), D()
+    methods = [
+        ('bound dispatcher', measure(lambda: d.m(*args))),
+        ('method on class', measure(lambda: c.m(*args))),
+    ]
+    for label, ns in results:
+        print('{0:<24} {1:8.1f} ns/call'.format(label, ns))
+    print('speedup over generic path: {0:.2f}x'.format(results[1][1] / results[2][1]))
+    print('with keyword arguments:')
+    for label, ns in keywords:
+        print('{0:<24} {1:8.1f} ns/call'.format(label, ns))
+    for label, ns in methods:
+        print('{0:<24} {1:8.1f} ns/call'.format(label, ns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures the cost of resolving a call that is not in the cache.
+
+Compares the linear scan performed by `find()` to the discrimination net
+for a function with many implementations.
+
+Usage: python benchmarks/bench_resolve.py [implementations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import overloading
+from overloading import overloaded, overloads
+
+
+NUMBER = 2000
+REPEAT = 5
+
+
+def make_classes(count):
+    """Creates `count` classes in chains of three levels of inheritance."""
+    classes = []
+    for i in range(count):
+        base = classes[-1] if i % 3 else object
+        classes.append(type('C{0}'.format(i), (base,), {}))
+    return classes
+
+
+def make_function(engine, classes):
+    @overloaded(engine=engine)
+    def f(x, y):
+        return None
+    for i, cls in enumerate(classes):
+        # Two implementations per class, distinguished by the second parameter.
+        for j, type_ in enumerate((int, str)):
+            namespace = {'X': cls, 'T': type_}
+            exec('def f(x: X, y: T): return {0}'.format(2 * i + j), namespace)
+            overloads(f)(namespace['f'])
+    return f
+
+
+def measure(stmt):
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) // 2 if len(sys.argv) > 1 else 20
+    classes = make_classes(count)
+    args = (classes[-1](), 'a')
+    results = []
+    for engine in ('scan', 'net'):
+        f = make_function(engine, classes)
+        results.append((engine, measure(lambda: overloading.find(f, args, {}))))
+    print('{0} implementations'.format(2 * count + 1))
+    for engine, us in results:
+        print('{0:<8} {1:8.2f} us/resolution'.format(engine, us))
+    print('speedup: {0:.2f}x'.format(results[0][1] / results[1][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,26 +18,71 @@ __all__ = ['overload', 'overloaded', 'overloads']
 
 
 
+import abc
+import array
 import ast
-from collections import Counter, defaultdict, namedtuple
-from functools import partial, reduce
+import builtins
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+import collections.abc
+from functools import cmp_to_key, partial, reduce, update_wrapper
 import inspect
-from itertools import chain
+from itertools import chain, islice, product
 import operator
 import re
 import sys
-from types import FunctionType
+from types import FunctionType, MethodType
+from weakref import WeakValueDictionary
 
 try:
     import typing
+    from typing import get_args, get_origin
 except ImportError:
+    # Type hints beyond plain classes require Python 3.8 or higher. An earlier
+    # version of `typing` is only kept around for rejecting its parameterized types.
+    legacy_typing = sys.modules.get('typing')
     typing = None
+else:
+    legacy_typing = None
 
-if sys.version_info < (3, 2):
-    raise ImportError("Module 'overloading' requires Python version 3.2 or higher.")
+try:
+    from types import UnionType
+except ImportError:
+    UnionType = None
+
+if sys.version_info < (3, 7):
+    raise ImportError("Module 'overloading' requires Python version 3.7 or higher.")
 
 DEBUG = False
 
+# The default maximum number of resolutions cached per overloaded function.
+# `None` means no limit.
+CACHE_SIZE = None
+
+# The maximum number of type relationships remembered across all overloaded
+# functions. `None` means no limit.
+TYPE_RELATIONS_SIZE = 4096
+
+# The maximum number of signatures that one with `Union` parameters is expanded
+# into, one for each combination of their members (see `expand_unions()`). Beyond
+# that, each `Union` is matched as a whole.
+MAX_UNION_ALTERNATIVES = 16
+
+# The default resolution engine: 'scan' compares the arguments against every
+# applicable signature, while 'net' first narrows down the candidates using
+# a discrimination net (see `DiscriminationNet`).
+ENGINE = 'scan'
+
+# The default policy for type-checking the contents of containers matched against
+# parameterized types such as `Iterable[int]`: 'first' inspects the first element
+# only, 'full' inspects every element, and an integer `k` inspects a sample of `k`
+# evenly spaced elements. Fixed-length tuples are always checked in full, and
+# iterators that would be consumed by the inspection only by their first element.
+ELEMENT_CHECK = 'first'
+
+# Whether iterators matched against parameterized types are wrapped by default,
+# so that the element inspected for type-checking is not lost (see `Peekable`).
+PEEK_ITERATORS = False
+
 
 
 ######
@@ -66,83 +111,51 @@ def overload(func):
         return __registry[fname]
 
 
-def overloaded(func):
+def overloaded(func=None, *, cache_size=None, engine=None, element_check=None, peek=None):
     """
     Introduces a new overloaded function and registers its first implementation.
+
+    `cache_size` limits the number of argument type combinations whose resolution
+    is remembered; the least recently used entries are discarded first. If omitted,
+    the value of ``CACHE_SIZE`` is used.
+
+    `engine` selects how a new combination of argument types is resolved, either
+    'scan' or 'net'. If omitted, the value of ``ENGINE`` is used.
+
+    `element_check` determines how much of a container is inspected when it is
+    matched against a parameterized type (see ``ELEMENT_CHECK``, which is used if
+    omitted). It may also be a dict that maps parameter names to policies; other
+    parameters then follow ``ELEMENT_CHECK``.
+
+    If `peek` is true, an iterator matched against a parameterized type is passed
+    to the implementation wrapped in a `Peekable`, which retains the element taken
+    for inspection. If omitted, the value of ``PEEK_ITERATORS`` is used.
     """
+    if func is None:
+        return partial(overloaded, cache_size=cache_size, engine=engine,
+                       element_check=element_check, peek=peek)
     fn = unwrap(func)
     ensure_function(fn)
+    if cache_size is None:
+        cache_size = CACHE_SIZE
+    if engine is None:
+        engine = ENGINE
+    if engine not in ('scan', 'net'):
+        raise OverloadingError("Unknown engine %r." % engine)
+    if element_check is None:
+        element_check = ELEMENT_CHECK
+    if isinstance(element_check, dict):
+        element_checks, element_check = element_check, ELEMENT_CHECK
+    else:
+        element_checks = {}
+    for policy in chain((element_check,), element_checks.values()):
+        if check_strength(policy) is None:
+            raise OverloadingError("Invalid element check %r." % (policy,))
 
-    def dispatcher(*args, **kwargs):
-
-        resolved = None
-        if dispatcher.__complex_parameters:
-            cache_key_pos = []
-            cache_key_kw = []
-            for argset in (0, 1) if kwargs else (0,):
-                if argset == 0:
-                    arg_pairs = enumerate(args)
-                    complexity_mapping = dispatcher.__complex_positions
-                else:
-                    arg_pairs = kwargs.items()
-                    complexity_mapping = dispatcher.__complex_parameters
-                for id, arg in arg_pairs:
-                    type_ = type(arg)
-                    element_type = None
-                    if id in complexity_mapping:
-                        try:
-                            element = next(iter(arg))
-                        except TypeError:
-                            pass
-                        except StopIteration:
-                            element_type = _empty
-                        else:
-                            complexity = complexity_mapping[id]
-                            if complexity & 8 and isinstance(arg, tuple):
-                                element_type = tuple(type(el) for el in arg)
-                            elif complexity & 4 and hasattr(arg, 'keys'):
-                                element_type = (type(element), type(arg[element]))
-                            else:
-                                element_type = type(element)
-                    if argset == 0:
-                        cache_key_pos.append((type_, element_type))
-                    else:
-                        cache_key_kw.append((id, type_, element_type))
-        else:
-            cache_key_pos = (type(arg) for arg in args)
-            cache_key_kw = ((name, type(arg)) for (name, arg) in kwargs.items()) if kwargs else None
-
-        cache_key = (tuple(cache_key_pos),
-                     tuple(sorted(cache_key_kw)) if kwargs else None)
+    if peek is None:
+        peek = PEEK_ITERATORS
 
-        try:
-            resolved = dispatcher.__cache[cache_key]
-        except KeyError:
-            resolved = find(dispatcher, args, kwargs)
-            if resolved:
-                dispatcher.__cache[cache_key] = resolved
-        if resolved:
-            before = dispatcher.__hooks['before']
-            after = dispatcher.__hooks['after']
-            if before:
-                before(*args, **kwargs)
-            result = resolved(*args, **kwargs)
-            if after:
-                after(*args, **kwargs)
-            return result
-        else:
-            return error(dispatcher.__name__)
-
-    dispatcher.__dict__.update(
-        __functions = [],
-        __hooks = {'before': None, 'after': None},
-        __cache = {},
-        __complex_positions = {},
-        __complex_parameters = {},
-        __maxlen = 0,
-    )
-    for attr in ('__module__', '__name__', '__qualname__', '__doc__'):
-        setattr(dispatcher, attr, getattr(fn, attr, None))
+    dispatcher = Dispatcher(fn, cache_size, engine, element_check, element_checks, peek)
     if is_void(fn):
         update_docstring(dispatcher, fn)
         return dispatcher
@@ -155,6 +168,11 @@ def overloads(dispatcher, hook=None):
     """
     Returns a callable that registers its argument as an implementation
     of a previously declared overloaded function.
+
+    If `hook` is given, the argument is instead appended to the hooks of that kind.
+    Hooks named 'before' and 'after' are called with the arguments of each call before
+    and after the implementation. An 'around' hook is called with a callable that
+    invokes the implementation, followed by the arguments, and returns the result.
     """
     return partial(register, dispatcher, hook=hook)
 
@@ -171,10 +189,14 @@ __registry = {}
 FunctionInfo = namedtuple('FunctionInfo', ('func', 'signature'))
 
 Signature = namedtuple('Signature', ('parameters', 'types', 'complexity', 'defaults', 'required',
-                                     'has_varargs', 'has_varkw', 'has_kwonly'))
+                                     'has_varargs', 'has_varkw', 'has_kwonly',
+                                     'param_count', 'required_count', 'parameter_set',
+                                     'positions', 'nullable'))
 
 _empty = object()
 
+NoneType = type(None)
+
 
 def register(dispatcher, func, *, hook=None):
     """
@@ -188,54 +210,112 @@ def register(dispatcher, func, *, hook=None):
     if isinstance(dispatcher, (classmethod, staticmethod)):
         wrapper = None
     dp = unwrap(dispatcher)
-    try:
-        dp.__functions
-    except AttributeError:
+    if not isinstance(dp, Dispatcher):
         raise OverloadingError("%r has not been set up as an overloaded function." % dispatcher)
     fn = unwrap(func)
     if hook:
-        dp.__hooks[hook] = func
+        if hook not in ('before', 'after', 'around'):
+            raise OverloadingError("Unknown hook type %r." % hook)
+        if dp._hooks is None:
+            dp._hooks = {'before': [], 'after': [], 'around': []}
+        dp._hooks[hook].append(func)
     else:
         signature = get_signature(fn)
         for i, type_ in enumerate(signature.types):
-            if not isinstance(type_, type):
+            if not isinstance(type_, TypeNode):
                 raise OverloadingError(
                   "Failed to overload function '{0}': parameter '{1}' has "
                   "an annotation that is not a type."
                   .format(dp.__name__, signature.parameters[i]))
-        for fninfo in dp.__functions:
+        for fninfo in dp._functions:
             dup_sig = sig_cmp(signature, fninfo.signature)
             if dup_sig and signature.has_varargs == fninfo.signature.has_varargs:
                 raise OverloadingError(
                   "Failed to overload function '{0}': non-unique signature ({1})."
                   .format(dp.__name__, str.join(', ', (_repr(t) for t in dup_sig))))
         # All clear; register the function.
-        dp.__functions.append(FunctionInfo(func, signature))
-        dp.__cache.clear()
-        dp.__maxlen = max(dp.__maxlen, len(signature.parameters))
+        new_functions = [FunctionInfo(func, sig) for sig in expand_unions(signature)]
+        dp._functions.extend(new_functions)
+        dp._shapes.clear()
+        if dp._engine == 'net':
+            dp._net = DiscriminationNet(dp._functions)
+        key_layout = (set(dp._key_positions), set(dp._key_parameters),
+                      dp._complex_positions, dp._complex_parameters, dp._position_checks,
+                      dp._tuple_lengths)
+        dp._maxlen = max(dp._maxlen, len(signature.parameters))
+        dp._parameter_names.update(signature.parameters)
+        # Only arguments whose type can influence the outcome need to be part of the
+        # cache key. An argument is irrelevant if every signature accepts any type
+        # for it, unless one of them also declares `None` as the default.
+        for i, (param, type_) in enumerate(zip(signature.parameters, signature.types)):
+            if type_ is not AnyType or signature.defaults.get(param, _empty) is None:
+                dp._key_positions.add(i)
+                dp._key_parameters.add(param)
         if typing:
             # For each parameter position and name, compute a bitwise union of complexity
-            # values over all registered signatures. Retain the result for parameters where
-            # a nonzero value occurs at least twice and at least one of those values is >= 2.
+            # values over all registered signatures. Retain the result for parameters that
+            # occur in at least two signatures when at least one of the values is >= 2.
             # Such parameters require deep type-checking during function resolution.
             position_values = defaultdict(lambda: 0)
             keyword_values = defaultdict(lambda: 0)
             position_counter = Counter()
             keyword_counter = Counter()
-            for fninfo in dp.__functions:
+            implementations = {}
+            for fninfo in dp._functions:
                 sig = fninfo.signature
-                complex_positions = {i: v for i, v in enumerate(sig.complexity) if v}
-                complex_keywords = {p: v for p, v in zip(sig.parameters, sig.complexity) if v}
-                for i, v in complex_positions.items():
+                for i, v in enumerate(sig.complexity):
                     position_values[i] |= v
-                for p, v in complex_keywords.items():
+                for p, v in zip(sig.parameters, sig.complexity):
                     keyword_values[p] |= v
-                position_counter.update(complex_positions.keys())
-                keyword_counter.update(complex_keywords.keys())
-            dp.__complex_positions = {
+                implementations[fninfo.func] = sig
+            # The alternatives of a `Union` parameter share an implementation, so there
+            # is no need to tell them apart. They have the same parameters as well.
+            for sig in implementations.values():
+                position_counter.update(range(len(sig.complexity)))
+                keyword_counter.update(sig.parameters)
+            dp._complex_positions = {
                 i: v for i, v in position_values.items() if v >= 2 and position_counter[i] > 1}
-            dp.__complex_parameters = {
+            dp._complex_parameters = {
                 p: v for p, v in keyword_values.items() if v >= 2 and keyword_counter[p] > 1}
+            # The contents of a positional argument are checked according to the strictest
+            # policy among the parameters at that position, so that the cache key always
+            # describes at least as much of the contents as the resolution inspects.
+            position_checks = {}
+            for fninfo in dp._functions:
+                for i, param in enumerate(fninfo.signature.parameters):
+                    policy = dp._element_checks.get(param, dp._element_check)
+                    if check_strength(policy) > check_strength(position_checks.get(i, 'first')):
+                        position_checks[i] = policy
+            dp._position_checks = position_checks
+            # The lengths of the fixed-length tuples declared for each parameter position
+            # and name. The element types of a tuple of any other length are irrelevant
+            # to those declarations, so they are left out of the cache key.
+            tuple_lengths = defaultdict(set)
+            for fninfo in dp._functions:
+                sig = fninfo.signature
+                for i, (param, type_) in enumerate(zip(sig.parameters, sig.types)):
+                    if isinstance(type_, TupleNode) and not type_.variadic:
+                        tuple_lengths[i].add(len(type_.parameters))
+                        tuple_lengths[param].add(len(type_.parameters))
+            dp._tuple_lengths = {id: frozenset(lengths) for id, lengths in tuple_lengths.items()}
+            if dp._peek:
+                # Unlike the cache key, the resolution inspects the contents of an argument
+                # even if only one signature declares a parameterized type for it.
+                dp._peek_positions = {i for i, v in position_values.items() if v >= 2}
+                dp._peek_parameters = {p for p, v in keyword_values.items() if v >= 2}
+        if key_layout == (dp._key_positions, dp._key_parameters, dp._complex_positions,
+                          dp._complex_parameters, dp._position_checks, dp._tuple_lengths):
+            evict(dp, [fninfo.signature for fninfo in new_functions])
+        else:
+            # The existing keys no longer describe the arguments the way new ones would.
+            dp._cache.clear()
+            dp._volatile_keys.clear()
+    if dp._specializations:
+        # Specializations call the implementations directly, so they are updated
+        # right away along with the dispatcher.
+        compile_dispatcher(dp)
+    else:
+        defer_compile(dp)
     if wrapper is None:
         wrapper = lambda x: x
     if func.__name__ == dp.__name__:
@@ -246,176 +326,1482 @@ def register(dispatcher, func, *, hook=None):
         return wrapper(func)
 
 
+class Dispatcher:
+    """
+    An overloaded function.
+
+    The state used for dispatching is kept in slots. Like a function, a dispatcher
+    also has an instance dictionary, which holds `__module__`, `__doc__`, and any
+    other attributes set on it, such as `__isabstractmethod__`. Calls go directly
+    to the function that `compile_dispatcher()` has generated and placed in the
+    `__call__` slot. Until the first call, the slot holds a function that generates it (see `defer_compile()`).
+    """
+
+    __slots__ = ('__call__', '__dict__', '__weakref__', '__name__', '__qualname__',
+                 '_functions', '_hooks', '_cache', '_cache_size',
+                 '_complex_positions', '_complex_parameters',
+                 '_key_positions', '_key_parameters', '_maxlen', '_namespace', '_method',
+                 '_shapes', '_specializations', '_engine', '_net', '_volatile_keys',
+                 '_element_check', '_element_checks', '_position_checks',
+                 '_peek', '_peek_positions', '_peek_parameters', '_tuple_lengths',
+                 '_parameter_names')
+
+    def __init__(self, func, cache_size=None, engine='scan',
+                 element_check='first', element_checks=None, peek=False):
+        for attr in ('__module__', '__name__', '__qualname__', '__doc__'):
+            setattr(self, attr, getattr(func, attr, None))
+        self._functions = []
+        self._cache = {} if cache_size is None else OrderedDict()
+        self._cache_size = cache_size
+        self._complex_positions = {}
+        self._complex_parameters = {}
+        self._key_positions = set()
+        self._key_parameters = set()
+        self._maxlen = 0
+        self._shapes = {}
+        self._engine = engine
+        self._net = None
+        self._volatile_keys = set()
+        self._element_check = element_check
+        self._element_checks = dict(element_checks or {})
+        self._position_checks = {}
+        self._peek = peek
+        self._peek_positions = set()
+        self._peek_parameters = set()
+        self._tuple_lengths = {}
+        self._parameter_names = set()
+        self._method = None
+        # Created on demand, as few dispatchers have hooks or are specialized
+        self._hooks = None
+        self._specializations = None
+        # Global namespace of the generated code. Before Python 3.10, functions
+        # find the builtins only through their globals.
+        self._namespace = {
+            '__builtins__': builtins,
+            'dispatcher': self,
+            'dispatch': dispatch,
+            'resolve': resolve,
+            'get_element_type': get_element_type,
+            'is_one_shot': is_one_shot,
+            'error': error,
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'get_cache_token': abc.get_cache_token,
+            'abc_token': abc.get_cache_token(),
+            'invalidate': invalidate,
+            'compile_dispatcher': compile_dispatcher,
+            'invoke': None,
+            # Created by `resolve()` when a call first fails
+            'no_match': None,
+        }
+        defer_compile(self)
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        return MethodType(self, obj)
+
+    def __set_name__(self, owner, name):
+        """
+        Replaces the dispatcher on the owner class with a plain function running the
+        same generated code.
+
+        Functions are bound to instances by the interpreter itself, which skips
+        creating a bound method for a call of the form `obj.method(...)`. The function
+        refers back to the dispatcher through `__wrapped__`.
+        """
+        if self._method is None:
+            method = FunctionType(self.__call__.__code__, self._namespace, name)
+            update_wrapper(method, self)
+            method.cache_info = self.cache_info
+            method.cache_clear = self.cache_clear
+            method.specialize = self.specialize
+            self._method = method
+        setattr(owner, name, self._method)
+
+    def __repr__(self):
+        return '<overloaded function %s>' % self.__qualname__
+
+    def __reduce__(self):
+        # Pickled by reference, just like a function. On a class, the name refers to
+        # the function installed by `__set_name__()`, which leads back to the dispatcher.
+        if self._method is not None:
+            return getattr, (self._method, '__wrapped__')
+        return self.__qualname__
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def __signature__(self):
+        return inspect.signature(self.__call__)
+
+    def cache_info(self):
+        """
+        Reports the resolution cache statistics.
+        """
+        namespace = self._namespace
+        return CacheInfo(namespace['hits'], namespace['misses'], namespace['evictions'],
+                         self._cache_size, len(self._cache))
+
+    def cache_clear(self):
+        """
+        Empties the resolution cache and resets its statistics.
+        """
+        self._cache.clear()
+        self._volatile_keys.clear()
+        self._namespace.update(hits=0, misses=0, evictions=0)
+
+    def specialize(self, *types, **kwtypes):
+        """
+        Returns a callable that invokes the implementation selected for arguments
+        of exactly the given types, skipping the resolution cache.
+
+        The callable checks the argument types on every call and falls back to the
+        overloaded function if they differ. It is kept up to date as implementations
+        and hooks are registered.
+        """
+        spec_key = (types, tuple(sorted(kwtypes.items())))
+        if self._specializations is None:
+            self._specializations = WeakValueDictionary()
+        specialization = self._specializations.get(spec_key)
+        if specialization is None:
+            if self.__call__.__code__ is compile_on_call.__code__:
+                compile_dispatcher(self)
+            specialization = compile_specialization(self, types, kwtypes)
+            self._specializations[spec_key] = specialization
+        return specialization
+
+
+def compile_dispatcher(dispatcher):
+    """
+    Generates a call path specialized for the current configuration of `dispatcher`
+    and installs it as the `__call__` of the dispatcher, as well as on the function
+    that represents the dispatcher on a class (see `Dispatcher.__set_name__()`).
+
+    The generated code builds the cache key inline for each positional argument count
+    accepted by the registered signatures, leaves out positions whose type is irrelevant,
+    and inspects container contents only at complex positions. Calls with any other
+    number of arguments, or with an iterator the dispatcher may peek into, are handed
+    over to `dispatch()`.
+
+    Calls with keyword arguments are looked up under the same key `dispatch()` would
+    build, so that cache hits avoid the general-purpose path. If the key would need
+    the contents of an argument or a peek into an iterator, they are handed over
+    to `dispatch()` as well.
+
+    Any registered hooks are composed into a separate function, `invoke()`, which
+    the generated code calls instead of the implementation. Without hooks, there
+    is no such indirection.
+
+    If only one implementation can accept a given number of arguments and it declares
+    no types for them, calls with that many arguments go directly to the implementation.
+
+    If any declared type can gain subclasses through ABC registration, the generated
+    code also compares the ABC cache token to the one seen previously and calls
+    `invalidate()` when it has changed.
+    """
+    functions = dispatcher._functions
+    hooks = dispatcher._hooks
+    hooked = hooks is not None
+    volatile = is_volatile(dispatcher)
+    targets = []
+
+    def invoke(func, indent):
+        if hooked:
+            return [indent + 'return invoke({0}, args, kwargs)'.format(func)]
+        else:
+            return [indent + 'return {0}(*args)'.format(func)]
+
+    def lookup(indent):
+        lines = [
+            'func = cache_get(key)',
+            'if func is None:',
+            '    func = resolve(dispatcher, key, args, kwargs)',
+            'else:',
+            '    hits += 1']
+        if dispatcher._cache_size is not None:
+            lines += [
+                '    try:',
+                '        cache_move(key)',
+                '    except KeyError:',
+                '        pass']
+        return [indent + line for line in lines]
+
+    def direct_target(candidates, arg_count):
+        if len(candidates) == 1:
+            func, sig = candidates[0]
+            if all(t is AnyType for t in sig.types[:arg_count]):
+                targets.append(func)
+                return 'targets[{0}]'.format(len(targets) - 1)
+        return None
+
+    source = [
+        'def dispatcher(*args, **kwargs):',
+        '    global hits']
+    if volatile:
+        source += [
+            '    if abc_token != get_cache_token():',
+            '        invalidate(dispatcher)']
+    source += [
+        '    n = len(args)',
+        '    if kwargs:']
+    if dispatcher._peek or dispatcher._complex_positions or dispatcher._complex_parameters:
+        source.append('        return dispatch(dispatcher, args, kwargs)')
+    else:
+        # Mirrors the key built by `dispatch()`.
+        keyed = 0
+        while keyed in dispatcher._key_positions:
+            keyed += 1
+        key_pos = ('(tuple(map(type, args)) if n <= {0} else '
+                   'tuple([type(arg) if i in key_positions else None '
+                   'for i, arg in enumerate(args)]))'.format(keyed))
+        key_kw = ('tuple([(name, type(arg) if name in key_parameters else None) '
+                  'for name, arg in kwargs.items()])')
+        source.append('        key = (None, {0}, {1})'.format(key_pos, key_kw))
+        source += lookup('        ')
+        # Passing the keywords on as they are is cheaper than reordering them
+        # into positional arguments.
+        if hooked:
+            source += [
+                '        if func is no_match:',
+                '            error(dispatcher.__name__)',
+                '        return invoke(func, args, kwargs)']
+        else:
+            source.append('        return func(*args, **kwargs)')
+    for n in range(dispatcher._maxlen + 1):
+        candidates = []
+        for func, sig in functions:
+            param_count = len(sig.parameters)
+            required_count = param_count - len(sig.defaults)
+            if required_count <= n and (n <= param_count or sig.has_varargs):
+                candidates.append((func, sig))
+        if not candidates:
+            continue
+        source.append('    elif n == {0}:'.format(n))
+        target = direct_target(candidates, n)
+        if target:
+            source += invoke(target, '        ')
+            continue
+        peek_positions = [i for i in range(n) if i in dispatcher._peek_positions]
+        if peek_positions:
+            source += [
+                '        if {0}:'.format(str.join(' or ', ('is_one_shot(args[{0}])'.format(i)
+                                                            for i in peek_positions))),
+                '            return dispatch(dispatcher, args, kwargs)']
+        key = []
+        for i in range(n):
+            if i not in dispatcher._key_positions:
+                continue
+            elif i in dispatcher._complex_positions:
+                lengths = ', tuple_lengths[{0}]'.format(i) if i in dispatcher._tuple_lengths else ''
+                key.append('(type(args[{0}]), get_element_type(args[{0}], {1}, {2!r}{3}))'
+                           .format(i, dispatcher._complex_positions[i],
+                                   dispatcher._position_checks.get(i, 'first'), lengths))
+            else:
+                key.append('type(args[{0}])'.format(i))
+        if len(key) < n:
+            # Keep keys for different argument counts apart.
+            key.insert(0, str(n))
+        source.append('        key = ({0})'.format(str.join('', (k + ', ' for k in key))))
+    target = direct_target([(func, sig) for func, sig in functions if sig.has_varargs],
+                           dispatcher._maxlen)
+    if target:
+        source.append('    elif n > {0}:'.format(dispatcher._maxlen))
+        source += invoke(target, '        ')
+    source += [
+        '    else:',
+        '        return dispatch(dispatcher, args, kwargs)']
+    source += lookup('    ')
+    if hooked:
+        source += [
+            '    if func is no_match:',
+            '        error(dispatcher.__name__)']
+    source += invoke('func', '    ')
+    if hooked:
+        # Before hooks, around hooks from the outermost inwards, and after hooks.
+        source.append('def invoke(func, args, kwargs):')
+        for i in range(len(hooks['before'])):
+            source.append('    before_hooks[{0}](*args, **kwargs)'.format(i))
+        if hooks['around']:
+            source.append('    result = around_chains[func](*args, **kwargs)')
+        else:
+            source.append('    result = func(*args, **kwargs)')
+        for i in range(len(hooks['after'])):
+            source.append('    after_hooks[{0}](*args, **kwargs)'.format(i))
+        source.append('    return result')
+    namespace = dispatcher._namespace
+    namespace.update(
+        cache_get = dispatcher._cache.get,
+        cache_move = getattr(dispatcher._cache, 'move_to_end', None),
+        targets = tuple(targets),
+        tuple_lengths = dispatcher._tuple_lengths,
+        key_positions = dispatcher._key_positions,
+        key_parameters = dispatcher._key_parameters,
+        invoke = None,
+    )
+    if hooked:
+        # The around hooks are bound to each implementation here rather than on every call.
+        around_chains = {}
+        for func, sig in functions:
+            around_chains[func] = reduce(lambda inner, hook: partial(hook, inner),
+                                         reversed(hooks['around']), func)
+        namespace.update(
+            before_hooks = tuple(hooks['before']),
+            after_hooks = tuple(hooks['after']),
+            around_chains = around_chains,
+        )
+    generated = make_functions(str.join('\n', source), namespace)
+    dispatcher.__call__ = generated['dispatcher']
+    if dispatcher._method is not None:
+        dispatcher._method.__code__ = dispatcher.__call__.__code__
+    if hooked:
+        namespace['invoke'] = generated['invoke']
+    for (types, kwtypes), specialization in (dispatcher._specializations or {}).items():
+        compile_specialization(dispatcher, types, dict(kwtypes), specialization)
+
+
+def defer_compile(dispatcher):
+    """
+    Postpones generating the call path of `dispatcher` until it is called, so that
+    registering a series of implementations generates it only once.
+    """
+    dispatcher.__call__ = FunctionType(compile_on_call.__code__, dispatcher._namespace)
+    if dispatcher._method is not None:
+        dispatcher._method.__code__ = compile_on_call.__code__
+
+
+# The code generated by `compile_dispatcher()` and `compile_specialization()`
+# by source text. Dispatchers configured alike generate the same source, so they
+# share the code and only have functions of their own.
+generated_code = {}
+
+
+def make_functions(source, namespace):
+    """
+    Creates the functions defined in `source` with `namespace` as their globals.
+    Returns them in a dict by name.
+
+    The source is compiled only the first time it is seen.
+    """
+    code = generated_code.get(source)
+    if code is None:
+        functions = {}
+        exec(compile(source, '<overloading>', 'exec'), {}, functions)
+        code = generated_code[source] = {name: func.__code__
+                                         for name, func in functions.items()}
+    return {name: FunctionType(func_code, namespace) for name, func_code in code.items()}
+
+
+# The following two functions run in the namespace of the generated code of a
+# dispatcher, where `dispatcher` refers to the dispatcher itself. Each dispatcher
+# creates its own functions from their code.
+
+def compile_on_call(*args, **kwargs):
+    """
+    Stands in for the generated code until the first call.
+    """
+    compile_dispatcher(dispatcher) # pylint: disable=undefined-variable
+    return dispatcher(*args, **kwargs) # pylint: disable=undefined-variable
+
+
+def no_match(*args, **kwargs):
+    """
+    Stands in for an implementation in cache entries recording a failed resolution.
+    """
+    error(dispatcher.__name__) # pylint: disable=undefined-variable
+
+
+def is_volatile(dispatcher):
+    """
+    Tells if the resolution of calls to `dispatcher` can be affected by registering
+    a class with an ABC.
+    """
+    return any(not has_fixed_subclasses(type_)
+               for func, sig in dispatcher._functions for type_ in sig.types)
+
+
+def compile_specialization(dispatcher, types, kwtypes, specialization=None):
+    """
+    Generates a function that calls the implementation `dispatcher` selects for
+    arguments of exactly `types` and `kwtypes`, guarded by a check of the actual types.
+
+    If `specialization` is given, its code and namespace are updated in place. Should the
+    types no longer be sufficient for resolution, the updated function simply calls
+    the dispatcher.
+    """
+    # Arguments checked against a parameterized type must be inspected on every call,
+    # unless their type rules the parameterized type out.
+    inspected = None
+    if typing:
+        candidates = get_candidates(dispatcher, len(types), kwtypes.keys()).candidates
+        for func, sig in candidates:
+            for pos, (param, expected) in enumerate(zip(sig.parameters, sig.types)):
+                type_ = types[pos] if pos < len(types) else kwtypes.get(param)
+                if type_ is None:
+                    continue
+                members = expected.members if isinstance(expected, UnionNode) else (expected,)
+                if any(t.complexity >= 2 and issubclass(type_, t.type) for t in members):
+                    inspected = param
+    namespace = {'__builtins__': builtins, 'dispatcher': dispatcher}
+    source = ['def specialization(*args, **kwargs):']
+    if inspected is None:
+        target = find(dispatcher, types, kwtypes, typeof=lambda t: t)
+        if target is None:
+            error(dispatcher.__name__)
+        namespace.update(
+            target = target,
+            invoke = dispatcher._namespace['invoke'],
+            kwnames = set(kwtypes),
+            get_cache_token = abc.get_cache_token,
+            abc_token = abc.get_cache_token(),
+        )
+        guard = ['len(args) == {0}'.format(len(types))]
+        if is_volatile(dispatcher):
+            # Leave it to the dispatcher to notice the change and update this function.
+            guard.append('abc_token == get_cache_token()')
+        for i, type_ in enumerate(types):
+            namespace['t{0}'.format(i)] = type_
+            guard.append('type(args[{0}]) is t{0}'.format(i))
+        if kwtypes:
+            guard.append('kwargs.keys() == kwnames')
+            for i, (name, type_) in enumerate(kwtypes.items()):
+                namespace['k{0}'.format(i)] = type_
+                guard.append('type(kwargs[{0!r}]) is k{1}'.format(name, i))
+        else:
+            guard.insert(0, 'not kwargs')
+        if dispatcher._hooks is not None:
+            call = 'invoke(target, args, kwargs)'
+        else:
+            call = 'target(*args, **kwargs)' if kwtypes else 'target(*args)'
+        source += [
+            '    if {0}:'.format(str.join(' and ', guard)),
+            '        return {0}'.format(call),
+        ]
+    elif specialization is None:
+        raise OverloadingError("Argument %r of %s() cannot be specialized on its type."
+                               % (inspected, dispatcher.__name__))
+    source.append('    return dispatcher(*args, **kwargs)')
+    generated = make_functions(str.join('\n', source), namespace)
+    if specialization is None:
+        specialization = generated['specialization']
+        specialization.__name__ = dispatcher.__name__
+        specialization.__qualname__ = dispatcher.__qualname__
+        specialization.__wrapped__ = dispatcher
+    else:
+        specialization.__code__ = generated['specialization'].__code__
+        specialization.__globals__.update(namespace)
+    return specialization
+
+
+def dispatch(dispatcher, args, kwargs):
+    """
+    Invokes the implementation that best matches `args` and `kwargs`.
+
+    This is the general-purpose call path for any combination of arguments.
+
+    If `dispatcher` peeks into iterators, the call is first resolved without
+    looking at their contents. Only if the outcome may depend on them are the
+    iterators wrapped in a `Peekable` and the call resolved again. Otherwise, the
+    implementation receives them as they are.
+    """
+    typeof = type
+    if dispatcher._peek:
+        unpeeked = find_iterators(dispatcher, args, kwargs)
+        if unpeeked:
+            resolved = lookup(dispatcher, make_key(dispatcher, args, kwargs, type, unpeeked),
+                              args, kwargs, unpeeked)
+            if resolved is not PEEK:
+                return call(dispatcher, resolved, args, kwargs)
+            args = peek_args(args, dispatcher._peek_positions)
+            kwargs = peek_keywords(kwargs, dispatcher._peek_parameters)
+            typeof = peeked_type
+    key = make_key(dispatcher, args, kwargs, typeof)
+    return call(dispatcher, lookup(dispatcher, key, args, kwargs), args, kwargs)
+
+
+def make_key(dispatcher, args, kwargs, typeof=type, unpeeked=()):
+    """
+    Builds the cache key `dispatch()` uses for `args` and `kwargs`.
+
+    The contents of the arguments identified by `unpeeked`, by position or by
+    name, are left out. Such a key ends with `PEEK`, so that it is set apart
+    from one that describes them.
+    """
+    key_positions = dispatcher._key_positions
+    key_parameters = dispatcher._key_parameters
+    if dispatcher._complex_positions or dispatcher._complex_parameters:
+        cache_key_pos = []
+        cache_key_kw = []
+        for argset in (0, 1) if kwargs else (0,):
+            if argset == 0:
+                arg_pairs = enumerate(args)
+                complexity_mapping = dispatcher._complex_positions
+                relevant = key_positions
+                checks, default_check = dispatcher._position_checks, 'first'
+            else:
+                arg_pairs = kwargs.items()
+                complexity_mapping = dispatcher._complex_parameters
+                relevant = key_parameters
+                checks, default_check = dispatcher._element_checks, dispatcher._element_check
+            for id, arg in arg_pairs:
+                type_ = typeof(arg) if id in relevant else None
+                element_type = None
+                if id in complexity_mapping and id not in unpeeked:
+                    element_type = get_element_type(arg, complexity_mapping[id],
+                                                    checks.get(id, default_check),
+                                                    dispatcher._tuple_lengths.get(id))
+                if argset == 0:
+                    cache_key_pos.append((type_, element_type))
+                else:
+                    cache_key_kw.append((id, type_, element_type))
+    else:
+        cache_key_pos = (typeof(arg) if i in key_positions else None
+                         for i, arg in enumerate(args))
+        cache_key_kw = ((name, typeof(arg) if name in key_parameters else None)
+                        for (name, arg) in kwargs.items()) if kwargs else None
+
+    # Keyword arguments are keyed in the order given, so each distinct ordering
+    # gets its own entry without having to be sorted first.
+    # The leading `None` sets these keys apart from those built by the generated code.
+    cache_key = (None, tuple(cache_key_pos),
+                 tuple(cache_key_kw) if kwargs else None)
+    if unpeeked:
+        cache_key += (PEEK,)
+    return cache_key
+
+
+def lookup(dispatcher, key, args, kwargs, unpeeked=()):
+    """
+    Returns the implementation cached under `key`, resolving the call if necessary.
+    """
+    resolved = dispatcher._cache.get(key)
+    if resolved is None:
+        resolved = resolve(dispatcher, key, args, kwargs, unpeeked)
+    else:
+        dispatcher._namespace['hits'] += 1
+        if dispatcher._cache_size is not None:
+            try:
+                dispatcher._cache.move_to_end(key)
+            except KeyError:
+                pass
+    return resolved
+
+
+def call(dispatcher, resolved, args, kwargs):
+    """
+    Invokes `resolved`, an implementation found by `lookup()`, along with any hooks.
+    """
+    namespace = dispatcher._namespace
+    if resolved is namespace['no_match']:
+        return error(dispatcher.__name__)
+    if namespace['invoke']:
+        return namespace['invoke'](resolved, args, kwargs)
+    else:
+        return resolved(*args, **kwargs)
+
+
+def find_iterators(dispatcher, args, kwargs):
+    """
+    Returns the positions and names of the arguments that `dispatcher` would have
+    to peek into, which are iterators matched against a parameterized type.
+    """
+    ids = {i for i in dispatcher._peek_positions if i < len(args) and is_one_shot(args[i])}
+    if kwargs:
+        ids.update(name for name in dispatcher._peek_parameters
+                   if name in kwargs and is_one_shot(kwargs[name]))
+    return ids
+
+
+# Stands in for an implementation in cache entries recording that a call
+# cannot be resolved without peeking into its iterators.
+PEEK = object()
+
+
+def resolve(dispatcher, key, args, kwargs, unpeeked=()):
+    """
+    Finds the implementation that best matches `args` and `kwargs`
+    and caches the result under `key`.
+
+    If there is no match, the failure is cached as well, so that repeating
+    the same invalid call raises the `TypeError` without another search. This is
+    not done if the call may have failed because of the contents of an argument
+    that `key` does not describe.
+
+    The contents of the iterators identified by `unpeeked` are assumed to match.
+    If the best match then declares a parameterized type for one of them, the
+    outcome depends on their contents, and `PEEK` is returned instead.
+    """
+    namespace = dispatcher._namespace
+    namespace['misses'] += 1
+    typeof = peeked_type if dispatcher._peek else type
+    resolved = find(dispatcher, args, kwargs, typeof, unpeeked)
+    if resolved is not None and unpeeked and inspects(dispatcher, resolved, unpeeked):
+        resolved = PEEK
+    failed = resolved is None
+    if failed:
+        resolved = namespace['no_match']
+        if resolved is None:
+            resolved = namespace['no_match'] = FunctionType(no_match.__code__, namespace)
+    shape = get_candidates(dispatcher, len(args), kwargs.keys())
+    if failed and has_unkeyed_contents(dispatcher, shape.candidates, len(args), kwargs):
+        return resolved
+    cache = dispatcher._cache
+    cache[key] = resolved
+    if shape.volatile:
+        dispatcher._volatile_keys.add(key)
+    if dispatcher._cache_size is not None:
+        while len(cache) > dispatcher._cache_size:
+            try:
+                evicted_key, _ = cache.popitem(last=False)
+            except KeyError:
+                break
+            dispatcher._volatile_keys.discard(evicted_key)
+            namespace['evictions'] += 1
+    return resolved
+
+
+def inspects(dispatcher, func, ids):
+    """
+    Tells if `func` declares a parameterized type for any of the arguments
+    identified by `ids`, by position or by name, in one of its signatures.
+    """
+    for fninfo in dispatcher._functions:
+        if fninfo.func is not func:
+            continue
+        sig = fninfo.signature
+        for id in ids:
+            pos = sig.positions.get(id) if isinstance(id, str) else id
+            if pos is not None and pos < sig.param_count and sig.types[pos].complexity >= 2:
+                return True
+    return False
+
+
+def has_unkeyed_contents(dispatcher, candidates, arg_count, kwargs):
+    """
+    Tells if any of `candidates` checks the contents of an argument whose cache key
+    component leaves them out, given `arg_count` positional arguments and `kwargs`.
+    """
+    for func, sig in candidates:
+        for i, type_ in enumerate(sig.types):
+            if type_.complexity < 2:
+                continue
+            if i < arg_count:
+                if i not in dispatcher._complex_positions:
+                    return True
+            elif sig.parameters[i] in kwargs:
+                if sig.parameters[i] not in dispatcher._complex_parameters:
+                    return True
+    return False
+
+
+def invalidate(dispatcher):
+    """
+    Discards the cached resolutions that may have been affected by registering
+    a class with an ABC, and updates the specializations of `dispatcher`.
+    """
+    dispatcher._namespace['abc_token'] = abc.get_cache_token()
+    cache = dispatcher._cache
+    for key in dispatcher._volatile_keys:
+        cache.pop(key, None)
+    dispatcher._volatile_keys.clear()
+    for (types, kwtypes), specialization in (dispatcher._specializations or {}).items():
+        compile_specialization(dispatcher, types, dict(kwtypes), specialization)
+
+
+def evict(dispatcher, signatures):
+    """
+    Discards the cached resolutions that may change now that `signatures` have been
+    registered on `dispatcher`, leaving the rest of the cache intact.
+
+    An entry is discarded if one of the signatures could accept the types recorded
+    in its key. Entries for calls a signature could come to accept after a class is
+    registered with an ABC are marked as volatile instead.
+    """
+    cache = dispatcher._cache
+    volatile_keys = dispatcher._volatile_keys
+    volatile = [not all(map(has_fixed_subclasses, sig.types)) for sig in signatures]
+    for key in list(cache):
+        arg_count, types, kwtypes = read_key(dispatcher, key)
+        for sig, sig_volatile in zip(signatures, volatile):
+            if not accepts_shape(sig, arg_count, kwtypes.keys()):
+                continue
+            if could_accept(sig, types, kwtypes):
+                del cache[key]
+                volatile_keys.discard(key)
+                break
+            if sig_volatile:
+                volatile_keys.add(key)
+
+
+def read_key(dispatcher, key):
+    """
+    Recovers the arguments described by a cache key of `dispatcher`.
+
+    Returns a tuple of the positional argument count, the types of the positional
+    arguments, and a dict mapping keyword argument names to types. The type is
+    None for an argument that was not recorded in the key.
+    """
+    if not key:
+        # Built by the generated code for a call without arguments.
+        return 0, [], {}
+    if key[0] is None:
+        # Built by `dispatch()`, possibly followed by `PEEK`.
+        pos, kw = key[1], key[2]
+        if dispatcher._complex_positions or dispatcher._complex_parameters:
+            types = [item[0] for item in pos]
+            kwtypes = {item[0]: item[1] for item in kw or ()}
+        else:
+            types = list(pos)
+            kwtypes = dict(kw or ())
+        return len(types), types, kwtypes
+    # Built by the generated code.
+    if isinstance(key[0], int):
+        arg_count, items = key[0], key[1:]
+    else:
+        arg_count, items = len(key), key
+    items = iter(items)
+    types = []
+    for i in range(arg_count):
+        if i not in dispatcher._key_positions:
+            types.append(None)
+        elif i in dispatcher._complex_positions:
+            types.append(next(items)[0])
+        else:
+            types.append(next(items))
+    return arg_count, types, {}
+
+
+def could_accept(sig, types, kwtypes):
+    """
+    Tells if the parameters of `sig` may accept arguments of `types` and `kwtypes`.
+
+    A type of None stands for any type. Only the class of an argument is considered,
+    so a parameterized type accepts any argument of the right class.
+    """
+    pairs = list(enumerate(types))
+    pairs.extend((sig.positions[name], type_) for name, type_ in kwtypes.items()
+                 if name in sig.positions)
+    for pos, type_ in pairs:
+        if type_ is None or pos >= sig.param_count:
+            continue
+        expected = sig.types[pos].type
+        if expected is None or type_ is NoneType and pos in sig.nullable:
+            continue
+        if not issubclass(type_, expected):
+            return False
+    return True
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits, misses, evictions, maxsize, currsize')
+
+
+def get_element_type(arg, complexity, check='first', lengths=None):
+    """
+    Describes the contents of the container `arg` for use in a cache key,
+    inspecting as much of them as the policy `check` calls for.
+
+    A container that reports its element type (see `get_reported_type()`) is
+    described by that type without inspecting the contents.
+
+    A tuple is described by the types of all of its elements if a fixed-length
+    tuple type is expected, unless its length is not among the given `lengths`
+    of the expected tuples.
+    """
+    if complexity & 8 and isinstance(arg, tuple):
+        if lengths is None or len(arg) in lengths:
+            return tuple(map(type, arg))
+        complexity &= ~8
+        if complexity < 2:
+            return None
+    reported = get_reported_type(arg)
+    if reported is not None:
+        return reported
+    if check != 'first' and not is_one_shot(arg):
+        try:
+            return get_item_types(arg, complexity & 4 and hasattr(arg, 'keys'), check)
+        except TypeError:
+            return None
+    try:
+        element = next(iter(arg))
+    except TypeError:
+        return None
+    except StopIteration:
+        return _empty
+    if complexity & 4 and hasattr(arg, 'keys'):
+        return (type(element), type(arg[element]))
+    else:
+        return type(element)
+
+
+def get_reported_type(value):
+    """
+    Returns the element type that the container `value` reports through the
+    ``__overload_element_type__`` protocol, or None if it doesn't.
+
+    The attribute is defined on the class of the container. It is either the type
+    itself or a method returning it, so that the contents never need to be accessed.
+    For a mapping, the type is a pair of the key type and the value type.
+
+    The element type of binary sequences, arrays, one-dimensional memoryviews,
+    and NumPy arrays other than those of Python objects is derived from the item
+    format or the dtype. A memoryview or a NumPy array of more than one dimension
+    consists of views or arrays, so its element type is its own class.
+    Empty ones are left untyped, so that they are accepted for any element type
+    just like other empty containers.
+    """
+    cls = type(value)
+    if getattr(cls, '__overload_element_type__', None) is not None:
+        reported = value.__overload_element_type__
+        if not isinstance(reported, (type, tuple)):
+            reported = reported()
+        return reported
+    if cls is bytes or cls is bytearray:
+        return int if value else None
+    if cls is memoryview:
+        if value.ndim == 1 and value:
+            return buffer_item_types.get(value.format.lstrip('@=<>!'))
+        elif value.ndim > 1 and value:
+            return cls
+        return None
+    if isinstance(value, array.array):
+        return buffer_item_types.get(value.typecode) if value else None
+    # NumPy is not imported here, so its arrays can only exist if it has been imported elsewhere.
+    numpy = sys.modules.get('numpy')
+    if (numpy is not None and isinstance(value, numpy.ndarray) and value.dtype.kind != 'O'
+            and value.size):
+        if value.ndim == 1:
+            return value.dtype.type
+        elif value.ndim > 1:
+            return cls
+    return None
+
+
+# The types of the items in a buffer or an array by format character or typecode
+buffer_item_types = dict(chain(
+    ((c, int) for c in 'bBhHiIlLqQnNP'),
+    ((c, float) for c in 'efd'),
+    ((c, str) for c in 'uw'),
+    [('?', bool), ('c', bytes)]))
+
+
+def get_item_types(value, mapping, check):
+    """
+    Collects the types of the elements of the container `value` that the policy
+    `check` calls for, other than 'first'. Returns a tuple holding a frozenset of
+    the element types, or of the key types and the value types if `mapping` is true.
+
+    A sequence is sampled at evenly spaced indices, so that the cache key and the
+    resolution of a call see the same elements. Other containers contribute their
+    first `check` elements.
+    """
+    if check == 'full':
+        if mapping:
+            return (frozenset(map(type, value)), frozenset(map(type, value.values())))
+        return (frozenset(map(type, value)),)
+    if isinstance(value, collections.abc.Sequence):
+        size = len(value)
+        if size > check:
+            items = [value[i * size // check] for i in range(check)]
+        else:
+            items = value
+    else:
+        items = list(islice(value, check))
+    if mapping:
+        return (frozenset(map(type, items)), frozenset(type(value[k]) for k in items))
+    return (frozenset(map(type, items)),)
+
+
+def check_strength(policy):
+    """
+    Orders the element check policies by how much of a container they inspect.
+    Returns None if `policy` is not valid.
+    """
+    if policy == 'first':
+        return 0
+    if policy == 'full':
+        return float('inf')
+    if isinstance(policy, int) and not isinstance(policy, bool) and policy > 0:
+        return policy
+    return None
+
+
+class Peekable:
+    """
+    An iterator that yields the elements of another, of which it has taken the first
+    in advance. The first element reveals the element type (see `get_reported_type()`)
+    without being lost to the consumer.
+    """
+
+    __slots__ = ('iterator', 'head')
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        try:
+            self.head = (next(iterator),)
+        except StopIteration:
+            self.head = ()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.head:
+            (element,), self.head = self.head, ()
+            return element
+        return next(self.iterator)
+
+    def __overload_element_type__(self):
+        return type(self.head[0]) if self.head else None
+
+    def __repr__(self):
+        return '<peekable %r>' % (self.iterator,)
+
+
+def is_one_shot(value):
+    """
+    Tells if `value` is an iterator whose elements cannot be inspected without
+    consuming them.
+    """
+    cls = type(value)
+    return hasattr(cls, '__next__') and getattr(cls, '__overload_element_type__', None) is None
+
+
+def peek_args(args, positions):
+    """
+    Returns `args` with the iterators at `positions` wrapped in a `Peekable`.
+    """
+    if any(i < len(args) and is_one_shot(args[i]) for i in positions):
+        args = tuple(Peekable(arg) if i in positions and is_one_shot(arg) else arg
+                     for i, arg in enumerate(args))
+    return args
+
+
+def peek_keywords(kwargs, names):
+    """
+    Returns `kwargs` with the iterators under `names` wrapped in a `Peekable`.
+    """
+    if any(name in kwargs and is_one_shot(kwargs[name]) for name in names):
+        kwargs = {name: Peekable(arg) if name in names and is_one_shot(arg) else arg
+                  for name, arg in kwargs.items()}
+    return kwargs
+
+
+def peeked_type(value):
+    """
+    Returns the type of `value`, or that of the wrapped iterator if it is a `Peekable`.
+    """
+    cls = type(value)
+    return type(value.iterator) if cls is Peekable else cls
+
+
 Match = namedtuple('Match', 'score, func, sig')
 
+# Outcomes of `relate()` for pairs of argument types and declared types, shared
+# by all overloaded functions. Subclass relationships can change when a class
+# is registered with an ABC, so the entries are only valid for one ABC cache token.
+type_relations = OrderedDict()
+type_relations_token = None
+
+# Stands for a type relationship that depends on the contents of the argument.
+INSPECT = object()
+
 SP_REGULAR = 5
 SP_ABSTRACT = 4
-SP_TYPING = 3
-SP_GENERIC = 2
 
 
-def find(dispatcher, args, kwargs):
+def find(dispatcher, args, kwargs, typeof=type, unchecked=()):
     """
     Given the arguments contained in `args` and `kwargs`, returns the best match
     from the list of implementations registered on `dispatcher`.
+
+    `typeof` maps an argument to its type. It can be replaced to resolve a call
+    from the argument types alone, provided that none of them needs to be inspected.
+
+    The contents of the arguments identified by `unchecked`, by position or by
+    name, are not inspected but assumed to match any declared type.
     """
+    check_type_relations()
     matches = []
-    full_args = args
-    full_kwargs = kwargs
-    for func, sig in dispatcher.__functions:
-        params = sig.parameters
-        param_count = len(params)
-        # Filter out arguments that will be consumed by catch-all parameters
+    arg_count = len(args)
+    candidates, ordered, volatile = get_candidates(dispatcher, arg_count, kwargs.keys())
+    checks = (dispatcher._position_checks, dispatcher._element_checks, dispatcher._element_check)
+    if unchecked:
+        position_checks = dict(checks[0])
+        keyword_checks = dict(checks[1])
+        for id in unchecked:
+            if isinstance(id, str):
+                keyword_checks[id] = None
+            else:
+                position_checks[id] = None
+        checks = (position_checks, keyword_checks, checks[2])
+    if dispatcher._net and not kwargs and len(candidates) > 1:
+        candidates = dispatcher._net.select(candidates, args, typeof)
+    for func, sig in candidates:
+        positions = sig.positions
+        # Discount arguments that will be consumed by catch-all parameters
         # or by keyword-only parameters.
-        if sig.has_varargs:
-            args = full_args[:param_count]
-        else:
-            args = full_args
-        if sig.has_varkw or sig.has_kwonly:
-            kwargs = {kw: full_kwargs[kw] for kw in params if kw in full_kwargs}
+        if sig.has_varargs and arg_count > sig.param_count:
+            pos_count = sig.param_count
         else:
-            kwargs = full_kwargs
-        kwarg_set = set(kwargs)
-        arg_count = len(args) + len(kwargs)
-        optional_count = len(sig.defaults)
-        required_count = param_count - optional_count
-        # Consider candidate functions that satisfy basic conditions:
-        # - argument count matches signature
-        # - all keyword arguments are recognized.
-        if not 0 <= param_count - arg_count <= optional_count:
-            continue
-        if kwargs and not kwarg_set <= set(params):
+            pos_count = arg_count
+        kwarg_count = 0
+        for name in kwargs:
+            param_pos = positions.get(name)
+            if param_pos is None:
+                continue
+            if param_pos < pos_count:
+                raise TypeError("%s() got multiple values for the same parameter"
+                                % dispatcher.__name__)
+            kwarg_count += 1
+        arg_score = pos_count + kwarg_count # >= 0
+        type_score = score_arguments(sig, args, pos_count, kwargs, typeof, checks=checks)
+        if type_score < arg_score:
             continue
-        if kwargs and args and kwarg_set & set(params[:len(args)]):
-            raise TypeError("%s() got multiple values for the same parameter"
-                            % dispatcher.__name__)
-        arg_score = arg_count # >= 0
-        type_score = 0
-        specificity_score = [None] * dispatcher.__maxlen
-        sig_score = required_count
+        if ordered and not DEBUG:
+            # Candidates are already sorted by rank, so this is the best match.
+            return func
+        specificity_score = [None] * dispatcher._maxlen
+        score_arguments(sig, args, pos_count, kwargs, typeof, specificity_score, checks)
+        sig_score = sig.required_count
         var_score = -sig.has_varargs
-        indexed_kwargs = ((params.index(k), v) for k, v in kwargs.items()) if kwargs else ()
-        for param_pos, value in chain(enumerate(args), indexed_kwargs):
-            param_name = params[param_pos]
-            if value is None and sig.defaults.get(param_name, _empty) is None:
-                expected_type = type(None)
-            else:
-                expected_type = sig.types[param_pos]
-            specificity = compare(value, expected_type)
-            if specificity[0] == -1:
-                break
-            specificity_score[param_pos] = specificity
-            type_score += 1
-        else:
-            score = (arg_score, type_score, specificity_score, sig_score, var_score)
-            matches.append(Match(score, func, sig))
+        score = (arg_score, type_score, specificity_score, sig_score, var_score)
+        matches.append(Match(score, func, sig))
     if matches:
         if len(matches) > 1:
+            first = matches[0]
             matches.sort(key=lambda m: m.score, reverse=True)
             if DEBUG:
-                assert matches[0].score > matches[1].score
+                # Unchecked contents may leave the best matches undecided.
+                assert matches[0].score > matches[1].score or \
+                       matches[0].func is matches[1].func or unchecked
+                assert not ordered or matches[0] is first
         return matches[0].func
     else:
         return None
 
 
-def compare(value, expected_type):
+def score_arguments(sig, args, pos_count, kwargs, typeof=type, specificity_score=None,
+                    checks=None):
+    """
+    Compares the first `pos_count` items in `args` and the items in `kwargs` to the
+    types declared in `sig`, ignoring keyword arguments not named in the parameter list.
+    Returns the number of arguments that match, stopping at the first one that doesn't.
+
+    If `specificity_score` is given, the result of each comparison is stored in it
+    at the position of the parameter.
+
+    `checks` holds the element check policies of the dispatcher: those by position,
+    those by parameter name, and the default for other parameters.
+    """
+    position_checks, keyword_checks, default_check = checks or ({}, {}, 'first')
+    matched = 0
+    for param_pos in range(pos_count):
+        specificity = score_argument(sig, param_pos, args[param_pos], typeof,
+                                     position_checks.get(param_pos, 'first'))
+        if specificity[0] == -1:
+            return matched
+        if specificity_score is not None:
+            specificity_score[param_pos] = specificity
+        matched += 1
+    if kwargs:
+        positions = sig.positions
+        for name, value in kwargs.items():
+            param_pos = positions.get(name)
+            if param_pos is None:
+                continue
+            specificity = score_argument(sig, param_pos, value, typeof,
+                                         keyword_checks.get(name, default_check))
+            if specificity[0] == -1:
+                return matched
+            if specificity_score is not None:
+                specificity_score[param_pos] = specificity
+            matched += 1
+    return matched
+
+
+def score_argument(sig, param_pos, value, typeof=type, check='first'):
+    """
+    Compares `value` to the type declared for the parameter at `param_pos` in `sig`.
+    """
+    if param_pos in sig.nullable and typeof(value) is NoneType:
+        return compare(value, NoneTypeNode, typeof)
+    else:
+        return compare(value, sig.types[param_pos], typeof, check)
+
+
+def get_candidates(dispatcher, arg_count, kwarg_names):
+    """
+    Returns the implementations registered on `dispatcher` that can accept
+    `arg_count` positional arguments together with keyword arguments named in
+    `kwarg_names`.
+
+    Returns a `Shape`. If `ordered` is true, the candidates are sorted by the rank
+    `find()` would give them for any arguments they accept. If `volatile` is true,
+    some of the declared types can gain subclasses through ABC registration.
+
+    The result is remembered for each call shape until the next registration.
+    Beyond the longest parameter list, the number of positional arguments makes
+    no difference, so all such counts share an entry. Shapes with keyword names
+    that no signature declares are not remembered, as their number is unlimited.
+    """
+    shape = (min(arg_count, dispatcher._maxlen + 1), frozenset(kwarg_names))
+    entry = dispatcher._shapes.get(shape)
+    if entry is not None:
+        return entry
+    kwarg_set = shape[1]
+    candidates = [fninfo for fninfo in dispatcher._functions
+                  if accepts_shape(fninfo.signature, arg_count, kwarg_set)]
+    ordered = None
+    if not kwarg_set and len(candidates) > 1:
+        ordered = rank_statically(candidates, arg_count)
+    volatile = any(not has_fixed_subclasses(type_)
+                   for func, sig in candidates for type_ in sig.types)
+    entry = Shape(ordered or tuple(candidates), ordered is not None, volatile)
+    if kwarg_set <= dispatcher._parameter_names:
+        dispatcher._shapes[shape] = entry
+    return entry
+
+
+Shape = namedtuple('Shape', 'candidates, ordered, volatile')
+
+
+def accepts_shape(sig, arg_count, kwarg_set):
+    """
+    Tells if `sig` can accept `arg_count` positional arguments together with
+    keyword arguments named in `kwarg_set`, disregarding their types.
+    """
+    param_count = sig.param_count
+    # Discount arguments that will be consumed by catch-all parameters
+    # or by keyword-only parameters.
+    if sig.has_varargs:
+        pos_count = min(arg_count, param_count)
+    else:
+        pos_count = arg_count
+    if sig.has_varkw or sig.has_kwonly:
+        kwargs = kwarg_set & sig.parameter_set
+    else:
+        kwargs = kwarg_set
+    # Consider candidate functions that satisfy basic conditions:
+    # - argument count matches signature
+    # - all keyword arguments are recognized.
+    if not 0 <= param_count - pos_count - len(kwargs) <= len(sig.defaults):
+        return False
+    if kwargs and not kwargs <= sig.parameter_set:
+        return False
+    return True
+
+
+def has_fixed_subclasses(type_):
+    """
+    Tells if the subclasses of `type_` are exactly those having it in their MRO,
+    which is not the case for ABCs and other types with a custom `__subclasscheck__`.
+    `Any` counts as having fixed subclasses, as it accepts everything.
+
+    The declared types of the contents, the members of a `Union`, and the bounds
+    of a type variable must have fixed subclasses as well.
+    """
+    if type_ is AnyType:
+        return True
+    if isinstance(type_, UnionNode):
+        return all(map(has_fixed_subclasses, type_.members))
+    if isinstance(type_, TypeVarNode):
+        return all(map(has_fixed_subclasses, type_.bounds))
+    if type(type_.type).__subclasscheck__ is not type.__subclasscheck__:
+        return False
+    return all(map(has_fixed_subclasses, getattr(type_, 'parameters', ())))
+
+
+def rank_statically(candidates, arg_count):
+    """
+    Sorts `candidates` for a call with `arg_count` positional arguments into the
+    order of the scores `find()` would assign, provided that this order is the same
+    for all argument types. Otherwise returns None.
+
+    The order is fixed when every declared type is either `Any` or a plain class,
+    since the rank of a plain class only depends on where it occurs in the MRO of
+    the argument type, and a subclass always comes before its bases. Two classes
+    unrelated to each other leave the order undecided, as does an optional
+    parameter defaulting to `None`.
+    """
+    keys = []
+    for func, sig in candidates:
+        count = min(arg_count, len(sig.parameters)) if sig.has_varargs else arg_count
+        for param, type_ in zip(sig.parameters[:count], sig.types):
+            if sig.defaults.get(param, _empty) is None:
+                return None
+            if type_ is AnyType:
+                continue
+            if (not isinstance(type_, ClassNode) or not has_fixed_subclasses(type_)
+                    or inspect.isabstract(type_.type)):
+                return None
+        # Corresponds to the score computed by `find()`.
+        keys.append((count, sig.types[:count], len(sig.parameters) - len(sig.defaults),
+                     -sig.has_varargs))
+
+    def cmp(key1, key2):
+        if key1[0] != key2[0]:
+            return key1[0] - key2[0]
+        for t1, t2 in zip(key1[1], key2[1]):
+            # `Any` ranks below any class, including `object`.
+            if t1 is AnyType or t2 is AnyType:
+                if t1 is t2:
+                    continue
+                return -1 if t1 is AnyType else 1
+            elif t1.type is t2.type:
+                continue
+            elif issubclass(t1.type, t2.type):
+                return 1
+            elif issubclass(t2.type, t1.type):
+                return -1
+            else:
+                return None
+        return (key1[2] - key2[2]) or (key1[3] - key2[3])
+
+    for i, key1 in enumerate(keys):
+        for key2 in keys[i+1:]:
+            if not cmp(key1, key2):
+                return None
+    order = sorted(range(len(keys)), key=cmp_to_key(lambda i, j: cmp(keys[j], keys[i])))
+    return tuple(candidates[i] for i in order)
+
+
+class DiscriminationNet:
+    """
+    Narrows down the implementations applicable to a positional call one argument
+    at a time, so that only the remaining candidates need to be ranked by `find()`.
+
+    For each parameter position, the net maps declared types to the implementations
+    that declare them, represented as bit masks. The implementations accepting an
+    argument are found by looking up each class in the MRO of its type. Declared types
+    with a custom subclass check, such as ABCs and typing constructs, cannot be found
+    this way and are tested with `issubclass()` on every lookup.
+
+    The lookups are remembered per position. Like the memo of type relationships,
+    each position holds at most `TYPE_RELATIONS_SIZE` argument types; when it fills
+    up, it is cleared.
+    """
+
+    __slots__ = ('bits', 'width', 'tables', 'checked', 'unconstrained', 'nullable', 'memo')
+
+    def __init__(self, functions):
+        self.bits = {}
+        self.width = width = max(len(sig.parameters) for func, sig in functions)
+        self.tables = [defaultdict(int) for _ in range(width)]
+        self.checked = [defaultdict(int) for _ in range(width)]
+        self.unconstrained = [0] * width
+        self.nullable = [0] * width
+        self.memo = [{} for _ in range(width)]
+        for i, fninfo in enumerate(functions):
+            bit = 1 << i
+            self.bits[id(fninfo)] = bit
+            sig = fninfo.signature
+            for pos in range(width):
+                if pos >= len(sig.parameters):
+                    # Consumed by `*args`, if accepted at all.
+                    self.unconstrained[pos] |= bit
+                    continue
+                type_ = sig.types[pos]
+                if sig.defaults.get(sig.parameters[pos], _empty) is None:
+                    self.nullable[pos] |= bit
+                # A `Union` that was not expanded (see `expand_unions()`)
+                for member in type_.members if isinstance(type_, UnionNode) else (type_,):
+                    if member is AnyType:
+                        self.unconstrained[pos] |= bit
+                    elif has_fixed_subclasses(member):
+                        self.tables[pos][member.type] |= bit
+                    else:
+                        self.checked[pos][member.type] |= bit
+        self.tables = [dict(table) for table in self.tables]
+        self.checked = [list(checked.items()) for checked in self.checked]
+
+    def select(self, candidates, args, typeof=type):
+        """
+        Returns the members of `candidates` that accept the types of `args`.
+        """
+        mask = -1
+        for pos, arg in enumerate(args[:self.width]):
+            type_ = typeof(arg)
+            memo = self.memo[pos]
+            accepted = memo.get(type_)
+            if accepted is None:
+                table = self.tables[pos]
+                accepted = self.unconstrained[pos]
+                for base in type_.__mro__:
+                    accepted |= table.get(base, 0)
+                if TYPE_RELATIONS_SIZE is not None and len(memo) >= TYPE_RELATIONS_SIZE:
+                    memo.clear()
+                memo[type_] = accepted
+            for expected_type, bits in self.checked[pos]:
+                if issubclass(type_, expected_type):
+                    accepted |= bits
+            if type_ is NoneType:
+                accepted |= self.nullable[pos]
+            mask &= accepted
+            if not mask:
+                return ()
+        bits = self.bits
+        return [fninfo for fninfo in candidates if bits[id(fninfo)] & mask]
+
+
+def compare(value, expected_type, typeof=type, check='first'):
     if expected_type is AnyType:
         return (0,)
-    type_ = type(value)
-    if not issubclass(type_, expected_type):
+    type_ = typeof(value)
+    relation = get_relation(type_, expected_type)
+    if relation is INSPECT:
+        if isinstance(expected_type, UnionNode):
+            return max(compare(value, t, typeof, check) for t in expected_type.members)
+        return score(value, type_, expected_type, check)
+    else:
+        return relation
+
+
+def get_relation(type_, expected_type):
+    """
+    Returns the outcome of `relate()` for `type_` and `expected_type`, remembering
+    it for all overloaded functions. When the memo is full, the oldest entry is
+    discarded.
+    """
+    key = (type_, expected_type)
+    relation = type_relations.get(key)
+    if relation is None:
+        relation = type_relations[key] = relate(type_, expected_type)
+        if TYPE_RELATIONS_SIZE is not None and len(type_relations) > TYPE_RELATIONS_SIZE:
+            type_relations.popitem(last=False)
+    return relation
+
+
+def check_type_relations():
+    """
+    Discards the remembered type relationships if a class has been registered
+    with an ABC since they were computed.
+    """
+    global type_relations_token
+    token = abc.get_cache_token()
+    if token != type_relations_token:
+        type_relations.clear()
+        type_relations_token = token
+
+
+def relate(type_, expected_type):
+    """
+    Determines how `type_` relates to `expected_type`, so that `compare()` can
+    look up the result for any argument of that type.
+
+    Returns the outcome of `compare()` unless it depends on the contents of the
+    argument, in which case `INSPECT` is returned.
+
+    A `Union` only occurs here if it has not been expanded (see `expand_unions()`).
+    It relates to `type_` as the best of its members does.
+    """
+    if isinstance(expected_type, UnionNode):
+        relations = [(0,) if t is AnyType else relate(type_, t) for t in expected_type.members]
+        return INSPECT if INSPECT in relations else max(relations)
+    if not issubclass(type_, expected_type.type):
         # Discard immediately on type mismatch.
         return (-1,)
-    type_tier = SP_REGULAR
-    type_specificity = 0
-    param_specificity = 0
-    mro_rank = 0
-    params = None
-    if typing and isinstance(expected_type, typing.UnionMeta):
-        types = [t for t in expected_type.__union_params__ if issubclass(type_, t)]
-        if len(types) > 1:
-            return max(map(partial(compare, value), types))
-        else:
-            expected_type = types[0]
-    if typing and isinstance(expected_type, (typing.TypingMeta, GenericWrapperMeta)):
-        type_tier = SP_TYPING
-        match = False
-        if isinstance(expected_type, typing.TupleMeta):
-            params = expected_type.__tuple_params__
-            if params:
-                if expected_type.__tuple_use_ellipsis__:
-                    match = len(value) == 0 or issubclass(type(value[0]), params[0])
-                else:
-                    match = len(value) == len(params) and \
-                            all(issubclass(type(v), t) for v, t in zip(value, params))
-                    param_specificity = 100
-            else:
-                match = True
-        elif isinstance(expected_type, GenericWrapperMeta):
-            type_tier = SP_GENERIC
-            type_specificity = len(expected_type.type.__mro__)
-            interface = expected_type.interface
-            params = expected_type.parameters
-            if expected_type.complexity > 1:
-                # Type-check the contents.
-                if interface is typing.Mapping:
-                    if len(value) == 0:
-                        match = True
-                    else:
-                        key = next(iter(value))
-                        item_types = (type(key), type(value[key]))
-                elif interface is typing.Iterable:
-                    try:
-                        item_types = (type(next(iter(value))),)
-                    except StopIteration:
-                        match = True
-                else:
-                    # Type-checking not implemented.
-                    match = True
-                if not match:
-                    type_vars = expected_type.type_vars
-                    for item_type, param, type_var in zip(item_types, params, type_vars):
-                        if isinstance(param, typing.TypeVar):
-                            type_var = param
-                            if type_var.__constraints__:
-                                param = type_var.__constraints__
-                                direct_match = item_type in param
-                            elif type_var.__bound__:
-                                param = type_var.__bound__
-                                direct_match = item_type is param
-                            else:
-                                direct_match = True
-                        elif param is AnyType:
-                            direct_match = True
-                        else:
-                            direct_match = item_type is param
-                        match = direct_match or \
-                                type_var.__covariant__ and issubclass(item_type, param) or \
-                                type_var.__contravariant__ and issubclass(param, item_type)
-                        if not match:
-                            break
-            else:
-                # No constrained parameters
-                match = True
-        else:
-            match = True
-        if not match:
-            return (-1,)
-        if params:
-            param_specificity += (sum(len(p.__mro__) for p in params if p is not AnyType)
-                                  / len(params))
-    if inspect.isabstract(expected_type):
-        type_tier = SP_ABSTRACT
+    if expected_type.complexity > 1:
+        return INSPECT
+    return score(None, type_, expected_type)
+
+
+def score(value, type_, expected_type, check='first'):
+    """
+    Computes the specificity of a match between `value` and `expected_type`,
+    given that `type_`, the type of `value`, is a subclass of the class
+    underlying `expected_type`.
+
+    If `expected_type` constrains the contents of `value`, they are checked first
+    according to the policy `check`.
+    """
+    if expected_type.complexity > 1 and not check_contents(value, expected_type, check):
+        return (-1,)
+    cls = expected_type.type
     try:
-        mro_rank = 100 - type_.__mro__.index(expected_type)
+        mro_rank = 100 - type_.__mro__.index(cls)
     except ValueError:
-        pass
-    if type_specificity == 0:
-        type_specificity = len(expected_type.__mro__)
-    if params:
-        return (mro_rank, type_tier, type_specificity, param_specificity)
-    else:
+        mro_rank = 0
+    type_tier = SP_ABSTRACT if inspect.isabstract(cls) else SP_REGULAR
+    type_specificity = len(cls.__mro__)
+    if isinstance(expected_type, ClassNode):
         return (mro_rank, type_tier, type_specificity)
+    else:
+        return (mro_rank, type_tier, type_specificity, expected_type.specificity)
+
+
+def check_contents(value, expected_type, check='first'):
+    """
+    Type-checks the contents of `value` against the parameters of `expected_type`,
+    which is a `TupleNode` or a `GenericNode`.
+
+    Every element of a fixed-length tuple is checked. Other containers are
+    assumed to be homogeneous, so by default only one element is inspected.
+    Other policies for `check` are described under ``ELEMENT_CHECK``. A container
+    that reports its element type is checked by that type alone. If `check` is
+    None, the contents are not inspected and assumed to match.
+    """
+    if check is None:
+        return True
+    params = expected_type.parameters
+    if isinstance(expected_type, TupleNode):
+        if not expected_type.variadic:
+            return len(value) == len(params) and \
+                   all(accepts(t, type(v), 1) for v, t in zip(value, params))
+        variances = (1,)
+    else:
+        variances = expected_type.variances
+    reported = get_reported_type(value)
+    if reported is not None:
+        item_types = (reported,) if isinstance(reported, type) else reported
+        return all(accepts(param, item_type, variance) for item_type, param, variance
+                   in zip(item_types, params, variances))
+    if check != 'first' and not is_one_shot(value):
+        mapping = isinstance(expected_type, GenericNode) and \
+                  expected_type.interface is collections.abc.Mapping
+        return all(accepts(param, item_type, variance) for item_types, param, variance
+                   in zip(get_item_types(value, mapping, check), params, variances)
+                   for item_type in item_types)
+    if isinstance(expected_type, TupleNode):
+        return len(value) == 0 or accepts(params[0], type(value[0]), 1)
+    if expected_type.interface is collections.abc.Mapping:
+        if len(value) == 0:
+            return True
+        key = next(iter(value))
+        item_types = (type(key), type(value[key]))
+    else:
+        try:
+            item_types = (type(next(iter(value))),)
+        except StopIteration:
+            return True
+    return all(accepts(param, item_type, variance) for item_type, param, variance
+               in zip(item_types, params, expected_type.variances))
+
+
+def accepts(type_, item_type, variance):
+    """
+    Tells if an item of `item_type` satisfies `type_`, the declared type of the
+    items in a container.
+
+    Unless the item type is the declared type itself, it must be a subclass
+    if the container is covariant (`variance` > 0) or a superclass if it is
+    contravariant (`variance` < 0). The variance of a type variable takes
+    precedence over that of the container.
+    """
+    if type_ is AnyType:
+        return True
+    if isinstance(type_, UnionNode):
+        return any(accepts(t, item_type, variance) for t in type_.members)
+    if isinstance(type_, TypeVarNode):
+        return any(accepts(t, item_type, type_.variance) for t in type_.bounds)
+    cls = type_.type
+    return item_type is cls or \
+           variance > 0 and issubclass(item_type, cls) or \
+           variance < 0 and issubclass(cls, item_type)
 
 
 def get_signature(func):
@@ -444,215 +1830,355 @@ def get_signature(func):
     required = types[:-len(defaults)] if defaults else types
 
     # Complexity
-    complexity = tuple(map(type_complexity, types)) if typing else None
+    complexity = tuple(t.complexity if t is not None else 0 for t in types)
+
+    # Lookup structures used in function resolution
+    param_count = len(parameters)
+    required_count = param_count - len(defaults)
+    parameter_set = frozenset(parameters)
+    positions = {param: i for i, param in enumerate(parameters)}
+    nullable = frozenset(positions[param] for param, value in defaults.items() if value is None)
 
     return Signature(parameters, types, complexity, defaults, required,
-                     has_varargs, has_varkw, has_kwonly)
+                     has_varargs, has_varkw, has_kwonly,
+                     param_count, required_count, parameter_set, positions, nullable)
 
 
-def iter_types(types):
-    for type_ in types:
-        if type_ is AnyType:
-            pass
-        elif issubclass(type_, typing.Union):
-            for t in iter_types(type_.__union_params__):
-                yield t
-        else:
-            yield type_
+def expand_unions(sig):
+    """
+    Splits a signature with `Union` parameters into one signature for each
+    combination of the `Union` members.
+
+    A `Union` parameter accepts a value if any of its members does, and the match
+    is as specific as the best of those members. Registering the alternatives
+    separately under the same implementation therefore yields the same outcome,
+    without `compare()` having to deal with a `Union`.
+
+    The number of combinations grows quickly with the number of `Union` parameters.
+    If it exceeds `MAX_UNION_ALTERNATIVES`, the signature is left as it is, and
+    `compare()` matches each `Union` as a whole.
+    """
+    members = [t.members if isinstance(t, UnionNode) else (t,) for t in sig.types]
+    count = reduce(operator.mul, map(len, members), 1)
+    if count == 1 or count > MAX_UNION_ALTERNATIVES:
+        return [sig]
+    alternatives = []
+    for types in product(*members):
+        required = types[:-len(sig.defaults)] if sig.defaults else types
+        complexity = tuple(t.complexity for t in types)
+        alternatives.append(sig._replace(types=types, required=required, complexity=complexity))
+    return alternatives
 
 
 def normalize_type(type_, level=0):
     """
-    Reduces an arbitrarily complex type declaration into something manageable.
+    Translates a type declaration into the node that represents it during function
+    resolution (see `TypeNode`). Returns `None` if `type_` is not a type.
+
+    Nodes are interned, so each declaration is analyzed only once and all of its
+    occurrences share the same node.
     """
-    if not typing or not isinstance(type_, typing.TypingMeta) or type_ is AnyType:
+    if isinstance(type_, TypeNode):
         return type_
-    if isinstance(type_, typing.TypeVar):
-        if type_.__constraints__ or type_.__bound__:
-            return type_
-        else:
-            return AnyType
-    if issubclass(type_, typing.Union):
-        if not type_.__union_params__:
-            raise OverloadingError("typing.Union must be parameterized")
-        return typing.Union[tuple(normalize_type(t, level) for t in type_.__union_params__)]
-    if issubclass(type_, typing.Tuple):
-        params = type_.__tuple_params__
-        if level > 0 or params is None:
-            return typing.Tuple
-        elif type_.__tuple_use_ellipsis__:
-            return typing.Tuple[normalize_type(params[0], level + 1), ...]
-        else:
-            return typing.Tuple[tuple(normalize_type(t, level + 1) for t in params)]
-    if issubclass(type_, typing.Callable):
-        return typing.Callable
-    if isinstance(type_, typing.GenericMeta):
-        base = find_base_generic(type_)
-        if base is typing.Generic:
-            return type_
-        else:
-            return GenericWrapper(type_, base, level > 0)
-    raise OverloadingError("%r not supported yet" % type_)
+    # Below the top level, the depth makes no difference.
+    key = (type_, level > 0)
+    try:
+        node = type_nodes.get(key)
+    except TypeError:
+        # Unhashable, so not a type either
+        return None
+    if node is None:
+        node = make_type_node(type_, level)
+        if node is not None:
+            type_nodes[key] = node
+    return node
 
 
-class GenericWrapperMeta(type):
+# Type nodes by declaration and whether it is nested in another type.
+# An entry disappears once nothing refers to the node anymore.
+type_nodes = WeakValueDictionary()
 
-    def __new__(mcs, name, bases, attrs, type_=None, base=None, simplify=False):
-        cls = super().__new__(mcs, name, bases, attrs)
-        if type_ is None:
-            return cls
-        if base is None:
-            base = find_base_generic(type_)
-        if simplify:
-            type_ = first_origin(type_)
-        cls.type = type_
-        cls.base = base
-        if issubclass(base, typing.Mapping):
-            cls.interface = typing.Mapping
-        elif issubclass(base, typing.Iterable):
-            cls.interface = typing.Iterable
-        else:
-            cls.interface = None
-        cls.derive_configuration()
-        cls.complexity = type_complexity(cls)
-        return cls
-
-    def __init__(cls, *_):
-        pass
-
-    def __call__(cls, type_, base=None, simplify=False):
-        return cls.__class__(cls.__name__, (), {}, type_, base, simplify)
-
-    def __eq__(cls, other):
-        if isinstance(other, GenericWrapperMeta):
-            return cls.type == other.type
-        elif isinstance(other, typing.GenericMeta):
-            return cls.type == other
-        else:
-            return False
 
-    def __hash__(cls):
-        return hash(cls.type)
+def make_type_node(type_, level):
+    """
+    Performs the work of `normalize_type()`.
+
+    Type parameters are only taken into account at the top level. A nested
+    parameterized type is reduced to its origin class, so that, for example,
+    `Sequence[Tuple[int, int]]` is handled as `Sequence[tuple]`.
+    """
+    if typing:
+        if type_ is typing.Any:
+            return AnyType
+        if isinstance(type_, typing.TypeVar):
+            constraints, bound = type_.__constraints__, type_.__bound__
+            if level > 0 and (constraints or bound):
+                return TypeVarNode(type_)
+            elif constraints:
+                return UnionNode(type_, tuple(normalize_type(t, level) for t in constraints))
+            elif bound:
+                return normalize_type(bound, level)
+            else:
+                return AnyType
+        origin = get_origin(type_)
+        if origin is not None:
+            return make_generic_node(type_, origin, get_args(type_), level)
+    if legacy_typing and type(type_).__module__ == legacy_typing.__name__:
+        if is_legacy_parameterized(type_):
+            raise OverloadingError("%r requires Python 3.8 or higher" % type_)
+        origin = getattr(type_, '__origin__', None)
+        if isinstance(origin, type):
+            # An unparameterized alias on Python 3.7, such as `typing.Iterable`
+            return ClassNode(type_, origin, 1)
+    if issubclass(type(type_), type):
+        return ClassNode(type_, type_)
+    if typing and type(type_).__module__ == typing.__name__:
+        raise OverloadingError("%r not supported yet" % type_)
+    return None
+
+
+def is_legacy_parameterized(type_):
+    """
+    Tells if `type_` is a parameterized type from a version of `typing` that
+    predates `typing.get_origin()`.
+    """
+    if getattr(type_, '_special', False):
+        # An unparameterized alias on Python 3.7
+        return False
+    return any(getattr(type_, attr, None) for attr in
+               ('__origin__', '__args__', '__union_params__', '__tuple_params__'))
 
-    def __repr__(cls):
-        return repr(cls.type)
 
-    def __instancecheck__(cls, obj):
-        return cls.type.__instancecheck__(obj)
+def make_generic_node(type_, origin, args, level):
+    """
+    Creates the node for a parameterized type or a `Union`, given the origin and
+    the arguments of `type_`.
+    """
+    if origin is typing.Union or UnionType and origin is UnionType:
+        return UnionNode(type_, tuple(normalize_type(t, level) for t in args))
+    if not isinstance(origin, type):
+        raise OverloadingError("%r not supported yet" % type_)
+    if level > 0 or not args or issubclass(origin, collections.abc.Callable):
+        return ClassNode(type_, origin, 1)
+    if origin is tuple:
+        if args[-1] is Ellipsis:
+            element = normalize_type(args[0], 1)
+            if element is AnyType:
+                return ClassNode(type_, origin, 1)
+            return TupleNode(type_, (element,), True)
+        if args == ((),):
+            # `Tuple[()]` prior to Python 3.11
+            args = ()
+        return TupleNode(type_, tuple(normalize_type(t, 1) for t in args), False)
+    interface, params = get_contents(origin, [(t, None) for t in args])
+    parameters = tuple(normalize_type(t, 1) for t, _ in params)
+    if not interface or all(p is AnyType for p in parameters):
+        # Nothing to check
+        return ClassNode(type_, origin, 1)
+    return GenericNode(type_, origin, interface, parameters, tuple(v for _, v in params))
+
+
+def get_contents(origin, args):
+    """
+    Determines how the type arguments of `origin` apply to the contents of
+    its instances.
+
+    `args` holds a pair for each type parameter of `origin`: the type argument and
+    its variance, or `None` if not yet known. Returns a tuple of the interface
+    through which the contents are accessed, either `Mapping` or `Iterable`,
+    and the pairs that apply to the keys and values or to the elements,
+    respectively. If the contents can't be checked, the interface is `None`.
+    """
+    if issubclass(origin, typing.Generic):
+        # A user-defined generic class: follow the type variables to the bases.
+        substitution = {}
+        for type_var, (arg, variance) in zip(origin.__parameters__, args):
+            if variance is None:
+                variance = get_variance(type_var)
+            substitution[type_var] = (arg, variance)
+        for base in getattr(origin, '__orig_bases__', ()):
+            base_origin = get_origin(base)
+            if not isinstance(base_origin, type) or base_origin is typing.Generic:
+                continue
+            base_args = [substitution.get(t, (t, None)) for t in get_args(base)]
+            interface, params = get_contents(base_origin, base_args)
+            if interface:
+                return interface, params
+        return None, ()
+    if issubclass(origin, collections.abc.Mapping):
+        interface = collections.abc.Mapping
+        mutable = collections.abc.MutableMapping
+    elif (issubclass(origin, collections.abc.Iterable)
+          and not issubclass(origin, collections.abc.ItemsView)):
+        interface = collections.abc.Iterable
+        mutable = (collections.abc.MutableSequence, collections.abc.MutableSet)
+    else:
+        return None, ()
+    # Mutable containers are invariant, as are the keys of a mapping.
+    params = []
+    for i, (arg, variance) in enumerate(args[:2 if interface is collections.abc.Mapping else 1]):
+        if variance is None:
+            if i == 0 and interface is collections.abc.Mapping or issubclass(origin, mutable):
+                variance = 0
+            else:
+                variance = 1
+        params.append((arg, variance))
+    return interface, tuple(params)
 
-    def __subclasscheck__(cls, other):
-        return cls.type.__subclasscheck__(other)
 
-    def derive_configuration(cls):
-        """
-        Collect the nearest type variables and effective parameters from the type,
-        its bases, and their origins as necessary.
-        """
-        base_params = cls.base.__parameters__
-        if hasattr(cls.type, '__args__'):
-            # typing as of commit abefbe4
-            tvars = {p: p for p in base_params}
-            types = {}
-            for t in iter_generic_bases(cls.type):
-                if t is cls.base:
-                    type_vars = tuple(tvars[p] for p in base_params)
-                    parameters = (types.get(tvar, tvar) for tvar in type_vars)
-                    break
-                if t.__args__:
-                    for arg, tvar in zip(t.__args__, t.__origin__.__parameters__):
-                        if isinstance(arg, typing.TypeVar):
-                            tvars[tvar] = tvars.get(arg, arg)
-                        else:
-                            types[tvar] = arg
-        else:
-            # typing 3.5.0
-            tvars = [None] * len(base_params)
-            for t in iter_generic_bases(cls.type):
-                for i, p in enumerate(t.__parameters__):
-                    if tvars[i] is None and isinstance(p, typing.TypeVar):
-                        tvars[i] = p
-                if all(tvars):
-                    type_vars = tvars
-                    parameters = cls.type.__parameters__
-                    break
-        cls.type_vars = type_vars
-        cls.parameters = tuple(normalize_type(p, 1) for p in parameters)
-
-
-class GenericWrapper(metaclass=GenericWrapperMeta):
-    pass
+def get_variance(type_var):
+    return 1 if type_var.__covariant__ else -1 if type_var.__contravariant__ else 0
 
 
-def type_complexity(type_):
-    """Computes an indicator for the complexity of `type_`.
+class TypeNode:
+    """
+    The internal representation of a declared type.
 
-    If the return value is 0, the supplied type is not parameterizable.
-    Otherwise, set bits in the return value denote the following features:
-    - bit 0: The type could be parameterized but is not.
+    `type` is the class an argument must be an instance of. `complexity` is an
+    indicator for how much inspection the argument requires: if it is 0, the
+    type is not parameterizable. Otherwise, set bits denote the following features:
+    - bit 0: The type could be parameterized but its parameters are not checked.
     - bit 1: The type represents an iterable container with 1 constrained type parameter.
     - bit 2: The type represents a mapping with a constrained value type (2 parameters).
     - bit 3: The type represents an n-tuple (n parameters).
     Since these features are mutually exclusive, only a `Union` can have more than one bit set.
+
+    `key` identifies the type for comparing signatures, and `source` is the
+    declaration the node was created from.
     """
-    if (not typing
-      or not isinstance(type_, (typing.TypingMeta, GenericWrapperMeta))
-      or type_ is AnyType):
-        return 0
-    if issubclass(type_, typing.Union):
-        return reduce(operator.or_, map(type_complexity, type_.__union_params__))
-    if issubclass(type_, typing.Tuple):
-        if type_.__tuple_params__ is None:
-            return 1
-        elif type_.__tuple_use_ellipsis__:
-            return 2
-        else:
-            return 8
-    if isinstance(type_, GenericWrapperMeta):
+
+    __slots__ = ('source', 'type', 'complexity', 'key', '__weakref__')
+
+    def __repr__(self):
+        return repr(self.source)
+
+
+class ClassNode(TypeNode):
+    """
+    A class, or a parameterized type whose parameters are not checked.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, source, cls, complexity=0):
+        self.source = source
+        self.type = cls
+        self.complexity = complexity
+        self.key = cls
+
+
+class TupleNode(TypeNode):
+    """
+    A tuple with a type declared for each element, or for all elements if `variadic`.
+    """
+
+    __slots__ = ('parameters', 'variadic', 'specificity')
+
+    def __init__(self, source, parameters, variadic):
+        self.source = source
+        self.type = tuple
+        self.parameters = parameters
+        self.variadic = variadic
+        self.complexity = 2 if variadic else 8
+        self.key = (tuple, tuple(p.key for p in parameters), variadic)
+        self.specificity = (0 if variadic else 100) + parameter_specificity(parameters)
+
+
+class GenericNode(TypeNode):
+    """
+    A container class with a declared type for its elements, or for the keys and
+    values if `interface` is `Mapping`. Each parameter has a variance: 1 for
+    covariant, -1 for contravariant, and 0 for invariant.
+    """
+
+    __slots__ = ('interface', 'parameters', 'variances', 'specificity')
+
+    def __init__(self, source, origin, interface, parameters, variances):
+        self.source = source
+        self.type = origin
+        self.interface = interface
+        self.parameters = parameters
+        self.variances = variances
         type_count = 0
-        for p in reversed(type_.parameters):
+        for p in reversed(parameters):
             if type_count > 0:
                 type_count += 1
-            if p is AnyType:
-                continue
-            if not isinstance(p, typing.TypeVar) or p.__constraints__ or p.__bound__:
-                type_count += 1
-        return 1 << min(type_count, 2)
-    return 0
+            elif p is not AnyType:
+                type_count = 1
+        self.complexity = 1 << min(type_count, 2)
+        self.key = (origin, tuple(p.key for p in parameters), variances)
+        self.specificity = parameter_specificity(parameters)
+
+
+class UnionNode(TypeNode):
+    """
+    A `Union`. A `Union` parameter is usually registered as separate
+    alternatives instead (see `expand_unions()`).
+    """
+
+    __slots__ = ('members',)
 
+    def __init__(self, source, members):
+        self.source = source
+        self.type = None
+        self.members = members
+        self.complexity = reduce(operator.or_, (t.complexity for t in members))
+        self.key = frozenset(t.key for t in members)
 
-def first_origin(type_):
-    while type_.__origin__:
-        type_ = type_.__origin__
-    return type_
 
+class TypeVarNode(TypeNode):
+    """
+    A type variable with constraints or an upper bound, occurring as a type parameter.
+    """
+
+    __slots__ = ('bounds', 'variance')
+
+    def __init__(self, type_var):
+        self.source = type_var
+        self.type = None
+        self.complexity = 0
+        self.key = type_var
+        self.variance = get_variance(type_var)
+        bounds = type_var.__constraints__ or (type_var.__bound__,)
+        self.bounds = tuple(normalize_type(t, 1) for t in bounds)
 
-def find_base_generic(type_):
-    """Locates the underlying generic whose structure and behavior are known.
 
-    For example, the base generic of a type that inherits from `typing.Mapping[T, int]`
-    is `typing.Mapping`.
+class AnyNode(TypeNode):
     """
-    for t in type_.__mro__:
-        if t.__module__ == typing.__name__:
-            return first_origin(t)
+    Accepts any value.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        self.source = typing.Any if typing else None
+        self.type = object
+        self.complexity = 0
+        self.key = AnyNode
 
 
-def iter_generic_bases(type_):
-    """Iterates over all generics `type_` derives from, including origins.
+AnyType = AnyNode()
 
-    This function is only necessary because, in typing 3.5.0, a generic doesn't
-    get included in the list of bases when it constructs a parameterized version
-    of itself. This was fixed in aab2c59; now it would be enough to just iterate
-    over the MRO.
+NoneTypeNode = normalize_type(NoneType)
+
+
+def parameter_specificity(parameters):
     """
-    for t in type_.__mro__:
-        if not isinstance(t, typing.GenericMeta):
-            continue
-        yield t
-        t = t.__origin__
-        while t:
-            yield t
-            t = t.__origin__
+    Averages the depth of the declared type parameters in the class hierarchy.
+    """
+    if not parameters:
+        return 0
+    return sum(type_depth(p) for p in parameters) / len(parameters)
+
+
+def type_depth(type_):
+    if type_ is AnyType:
+        return 0
+    if isinstance(type_, UnionNode):
+        return min(map(type_depth, type_.members))
+    if isinstance(type_, TypeVarNode):
+        return min(map(type_depth, type_.bounds))
+    return len(type_.type.__mro__)
 
 
 def sig_cmp(sig1, sig2):
@@ -696,35 +2222,16 @@ def type_cmp(t1, t2):
         return False
     if t2 is AnyType and t1 is not AnyType:
         return False
-    if t1 == t2:
+    if t1.key == t2.key:
         return t1
-    if typing:
-        if isinstance(t1, typing.UnionMeta) and isinstance(t2, typing.UnionMeta):
-            common = t1.__union_set_params__ & t2.__union_set_params__
-            if common:
-                return next(iter(common))
-        elif isinstance(t1, typing.UnionMeta) and t2 in t1.__union_params__:
-            return t2
-        elif isinstance(t2, typing.UnionMeta) and t1 in t2.__union_params__:
-            return t1
+    if isinstance(t1, UnionNode) or isinstance(t2, UnionNode):
+        for m1 in t1.members if isinstance(t1, UnionNode) else (t1,):
+            for m2 in t2.members if isinstance(t2, UnionNode) else (t2,):
+                if m1.key == m2.key:
+                    return m1
     return False
 
 
-class AnyTypeMeta(type):
-    def __subclasscheck__(cls, other):
-        if not isinstance(other, type):
-            return super().__subclasscheck__(other)
-        return True
-
-
-class AnyType(metaclass=AnyTypeMeta):
-    pass
-
-
-if typing:
-    AnyType = typing.Any
-
-
 def error(name):
     """
     Raises a `TypeError` when a call to an overloaded function
@@ -763,10 +2270,13 @@ def is_void(func):
     except (OSError, IOError):
         return False
     fdef = next(ast.iter_child_nodes(ast.parse(source)))
-    return (
-      type(fdef) is ast.FunctionDef and len(fdef.body) == 1 and
-      type(fdef.body[0]) is ast.Expr and
-      type(fdef.body[0].value) in {ast.Str, ast.Ellipsis})
+    if not (type(fdef) is ast.FunctionDef and len(fdef.body) == 1 and
+            type(fdef.body[0]) is ast.Expr):
+        return False
+    expr = fdef.body[0].value
+    if sys.version_info < (3, 8):
+        return type(expr) in {ast.Str, ast.Ellipsis}
+    return type(expr) is ast.Constant and (isinstance(expr.value, str) or expr.value is Ellipsis)
 
 
 def update_docstring(dispatcher, func=None):
@@ -779,12 +2289,12 @@ def update_docstring(dispatcher, func=None):
         return
     sig = '(...)'
     if func and func.__code__.co_argcount:
-        argspec = inspect.getfullargspec(func) # pylint: disable=deprecated-method
-        if argspec.args and argspec.args[0] in {'self', 'cls'}:
-            argspec.args.pop(0)
-        if any(argspec):
-            sig = inspect.formatargspec(*argspec) # pylint: disable=deprecated-method
-            sig = re.sub(r' at 0x[0-9a-f]{8,16}(?=>)', '', sig)
+        signature = inspect.signature(func)
+        params = list(signature.parameters.values())
+        if params[0].name in {'self', 'cls'}:
+            signature = signature.replace(parameters=params[1:])
+        if signature.parameters or signature.return_annotation is not signature.empty:
+            sig = re.sub(r' at 0x[0-9a-f]{8,16}(?=>)', '', str(signature))
     sep = '\n' if doc.startswith('\n') else '\n\n'
     dispatcher.__doc__ = dispatcher.__name__ + sig + sep + doc
 
@@ -65,8 +65,8 @@ for _ in range(rounds):
     assert g(a)          == ('any')
     assert g(a, 2)       == ('any', 'int')
 
-assert len(f.__cache) == 10
-assert len(g.__cache) == 3
+assert len(f._cache) == 8
+assert len(g._cache) == 2
 
 assert len(overloading.__registry) == 2
 
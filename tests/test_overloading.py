@@ -1,6 +1,14 @@
+import abc
+import array
 import collections
+import collections.abc
+import copy
 from functools import wraps
+import inspect
+import io
+from itertools import chain, product
 from numbers import Number
+import pickle
 import sys
 
 import pytest
@@ -11,10 +19,10 @@ from overloading import OverloadingError, typing
 
 if typing:
     from typing import (
-        Any, Callable, Generic, Optional, TypeVar, Union, Tuple,
+        Any, Callable, Dict, FrozenSet, Generic, Optional, TypeVar, Union, Tuple,
         MutableSequence, Sequence, Iterable, Mapping)
 else:
-    from collections import Sequence, Iterable
+    from collections.abc import Sequence, Iterable
 
 
 __all__ = ['rounds', 'decorated',
@@ -124,8 +132,8 @@ def test_basics_2():
         assert g(a)          == ('any')
         assert g(a, 2)       == ('any', 'int')
 
-    assert len(f.__cache) == 10
-    assert len(g.__cache) == 3
+    assert len(f._cache) == 8
+    assert len(g._cache) == 2
 
 
 @pytest.mark.parametrize('typing', (None, typing))
@@ -201,7 +209,7 @@ def test_kwargs_1():
         with pytest.raises(TypeError):
             f(a, bar=2, foo=1)
 
-    assert len(f.__cache) == 12
+    assert len(f._cache) == 11
 
 
 def test_kwargs_2():
@@ -237,7 +245,7 @@ def test_kwargs_2():
         assert f(foo=a, u=1)       == ('any', 'any?', 'int?', 'varkw')
         assert f(u=1, v=1)         == 'varkw'
 
-    assert len(f.__cache) == 13
+    assert len(f._cache) == 12
 
 
 def test_kwargs_3():
@@ -259,6 +267,251 @@ def test_kwargs_3():
         assert f(a, 2, baz=a) == ('any', 'int', 'any?', 'any?')
 
 
+def test_kwargs_binding():
+
+    @overloaded
+    def f(foo, bar:int, baz=None):
+        return (foo, bar, baz)
+
+    @overloads(f)
+    def f(foo, bar:str, *, quux=None):
+        return (foo, bar, quux)
+
+    for _ in range(rounds):
+        assert f(a, bar=1)            == (a, 1, None)
+        assert f(a, baz=c, bar=1)     == (a, 1, c)
+        assert f(foo=a, bar=1, baz=c) == (a, 1, c)
+        assert f(a, bar=b, quux=c)    == (a, b, c)
+
+    assert len(f._cache) == 4
+
+    # The generated code and `dispatch()` key keyword calls alike.
+    misses = f.cache_info().misses
+    assert overloading.dispatch(f, (a,), {'baz': c, 'bar': 1}) == (a, 1, c)
+    assert overloading.dispatch(f, (a,), {'bar': b, 'quux': c}) == (a, b, c)
+    assert f.cache_info().misses == misses
+
+
+def test_dispatch_before_call():
+
+    @overloaded
+    def f(foo: int):
+        return int
+
+    @overloads(f)
+    def f(foo: str):
+        return str
+
+    # The call path has not been generated yet.
+    assert overloading.dispatch(f, (1,), {}) == int
+    assert overloading.dispatch(f, (), {'foo': 'a'}) == str
+
+
+def test_allocations():
+
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    @overloaded
+    def f(foo, bar=None, *args):
+        return 1
+
+    @overloads(f)
+    def f(foo: int, bar: str, baz=None):
+        return 2
+
+    @overloads(f)
+    def f(foo: str, bar: int, baz: float = 1.0, **kwargs):
+        return 3
+
+    @overloads(f)
+    def f(foo: float, *, bar):
+        return 4
+
+    def measure(*args, **kwargs):
+        overloading.find(f, args, kwargs)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            overloading.find(f, args, kwargs)
+            return tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+
+    # Resolution should only allocate the scores of matching candidates.
+    budget = 768
+    assert measure(1, a)               < budget
+    assert measure(a, bar=1, baz=1.0)  < budget
+    assert measure(1.0, bar=1)         < budget
+    assert measure(x, y, z, w)         < budget
+
+
+def test_candidates():
+
+    @overloaded
+    def f(foo, *args):
+        return 1
+
+    @overloads(f)
+    def f(foo, bar, baz=None):
+        return 2
+
+    @overloads(f)
+    def f(foo, *, quux):
+        return 3
+
+    @overloads(f)
+    def f(foo=None, **kwargs):
+        return 4
+
+    def get_candidates(*shape):
+        ids = {fninfo.func: i for i, fninfo in enumerate(f._functions, 1)}
+        return [ids[fninfo.func] for fninfo in overloading.get_candidates(f, *shape)[0]]
+
+    assert get_candidates(0, ())               == [4]
+    assert get_candidates(1, ())               == [1, 3, 4]
+    assert get_candidates(2, ())               == [2, 1]
+    assert get_candidates(9, ())               == [1]
+    assert get_candidates(1, ('bar',))         == [2, 3, 4]
+    assert get_candidates(1, ('bar', 'baz'))   == [2, 3, 4]
+    assert get_candidates(1, ('quux',))        == [3, 4]
+    assert get_candidates(0, ('foo', 'quux'))  == [3, 4]
+    assert get_candidates(2, ('foo',))         == [2]
+    assert (9, frozenset()) not in f._shapes
+    # Shapes with undeclared keyword names are not remembered.
+    shapes = dict(f._shapes)
+    for i in range(100):
+        assert get_candidates(1, ('x%d' % i,)) == [3, 4]
+    assert f._shapes == shapes
+
+    @overloads(f)
+    def f(foo, bar, baz, *args):
+        return 5
+
+    assert not f._shapes
+    assert get_candidates(9, ()) == [5, 1]
+
+
+def test_static_order():
+
+    @overloaded
+    def f(foo, *args):
+        return 1
+
+    @overloads(f)
+    def f(foo: X, bar):
+        return 2
+
+    @overloads(f)
+    def f(foo: Y, bar, baz=1):
+        return 3
+
+    @overloads(f)
+    def f(foo: Z, bar: X, *args):
+        return 4
+
+    @overloads(f)
+    def f(foo, bar: int, baz: X):
+        return 5
+
+    def find(*args):
+        overloading.DEBUG = False
+        try:
+            return overloading.find(f, args, {})
+        finally:
+            overloading.DEBUG = True
+
+    values = (x, y, z, 1, None)
+    for args in chain.from_iterable(product(values, repeat=n) for n in range(1, 5)):
+        assert find(*args) is overloading.find(f, args, {})
+
+    assert overloading.get_candidates(f, 2, ())[1]
+    assert overloading.get_candidates(f, 3, ())[1]
+
+    @overloads(f)
+    def f(foo: int, bar):
+        return 6
+
+    assert not overloading.get_candidates(f, 2, ())[1]
+    assert find(1, 1) is overloading.find(f, (1, 1), {})
+    assert overloading.get_candidates(f, 4, ())[1]
+
+    @overloads(f)
+    def f(foo, bar, baz: Number, quux):
+        return 7
+
+    assert not overloading.get_candidates(f, 4, ())[1]
+
+    # A declared `object` is more specific than no declaration.
+    @overloaded
+    def g(foo: object, bar):
+        return 1
+
+    @overloads(g)
+    def g(foo, bar: int):
+        return 2
+
+    assert overloading.get_candidates(g, 2, ())[1]
+    for _ in range(rounds):
+        assert g(1, 2) == 1
+        assert g(1, a) == 1
+        assert g(None, 2) == 1
+
+
+def test_engines():
+
+    def make(engine):
+
+        @overloaded(engine=engine)
+        def f(foo, *args):
+            return 1
+
+        @overloads(f)
+        def f(foo: X, bar: Number):
+            return 2
+
+        @overloads(f)
+        def f(foo: Y, bar: int = None):
+            return 3
+
+        @overloads(f)
+        def f(foo: Z, bar, baz: Sequence):
+            return 4
+
+        @overloads(f)
+        def f(foo: Y, bar: Number, baz: str = None):
+            return 5
+
+        @overloads(f)
+        def f(foo: X, bar: float, baz, *args):
+            return 6
+
+        return f
+
+    scan, net = make('scan'), make('net')
+    assert net._net and not scan._net
+    def find(f, args):
+        func = overloading.find(f, args, {})
+        return func and [fninfo.func for fninfo in f._functions].index(func)
+
+    values = (x, y, z, 1, 1.0, a, [], None)
+    for args in chain.from_iterable(product(values, repeat=n) for n in range(1, 5)):
+        assert find(net, args) == find(scan, args)
+
+    # The per-position memo of the net is bounded.
+    size = overloading.TYPE_RELATIONS_SIZE
+    overloading.TYPE_RELATIONS_SIZE = 10
+    try:
+        for i in range(50):
+            T = type('T%d' % i, (X,), {})
+            assert find(net, (T(), 1)) == find(scan, (T(), 1)) == 1
+        assert all(len(memo) <= 10 for memo in net._net.memo)
+    finally:
+        overloading.TYPE_RELATIONS_SIZE = size
+
+    with pytest.raises(OverloadingError):
+        overloaded(engine='tree')(lambda: None)
+
+
 def test_kwonlyargs():
 
     @overloaded
@@ -272,7 +525,7 @@ def test_kwonlyargs():
     for _ in range(rounds):
         assert f(a, 2, kwonly=3) == ('str', 'int')
 
-    assert len(f.__cache) == 1
+    assert len(f._cache) == 1
 
 
 def test_default_1():
@@ -304,7 +557,7 @@ def test_default_1():
         assert f(a, b)       == ('any', 'any')
         assert f(a, b, c)    == 'default'
 
-    assert len(f.__cache) == 5
+    assert len(f._cache) == 3
 
 
 def test_default_2():
@@ -321,7 +574,7 @@ def test_default_2():
         assert f()  == 'empty'
         assert f(1) == 'default'
 
-    assert len(f.__cache) == 2
+    assert len(f._cache) == 1
 
 
 def test_nodefault():
@@ -342,7 +595,7 @@ def test_nodefault():
         with pytest.raises(TypeError):
             f(1, 2, 3)
 
-    assert len(f.__cache) == 2
+    assert len(f._cache) == 2
 
 
 def test_function_ordering_1():
@@ -463,7 +716,7 @@ def test_arg_subtyping_1():
     assert f(y, 1) == ('Y', 'any')
 
     @overloaded
-    def f(foo:collections.Iterable):
+    def f(foo:collections.abc.Iterable):
         return ('Iterable')
 
     @overloads(f)
@@ -560,9 +813,9 @@ def test_arg_subtyping_5():
 
 def test_abc():
 
-    Iterable = collections.Iterable
-    Sequence = collections.Sequence
-    MutableSequence = collections.MutableSequence
+    Iterable = collections.abc.Iterable
+    Sequence = collections.abc.Sequence
+    MutableSequence = collections.abc.MutableSequence
 
     @overloaded
     def f(u:Iterable, x:int, y:Iterable, z:int):
@@ -596,6 +849,162 @@ def test_abc():
         assert f([1, 2, 3], [1, 2, 3], [1, 2, 3]) == (Iterable, MutableSequence, Sequence)
 
 
+def test_type_relations():
+
+    class A(metaclass=abc.ABCMeta):
+        pass
+
+    class B:
+        pass
+
+    @overloaded(engine='scan')
+    def f(foo):
+        return 1
+
+    @overloads(f)
+    def f(foo: A):
+        return 2
+
+    @overloads(f)
+    def f(foo: B):
+        return 3
+
+    assert f(B()) == 3
+    A_node = overloading.normalize_type(A)
+    assert overloading.type_relations[(B, A_node)] == (-1,)
+    A.register(B)
+    assert f(B()) == 3
+    assert overloading.type_relations[(B, A_node)] != (-1,)
+
+    size = overloading.TYPE_RELATIONS_SIZE
+    overloading.TYPE_RELATIONS_SIZE = 2
+    try:
+        f(1)
+        assert len(overloading.type_relations) == 2
+        assert (B, A_node) not in overloading.type_relations
+    finally:
+        overloading.TYPE_RELATIONS_SIZE = size
+
+
+def test_abc_registration():
+
+    class A(metaclass=abc.ABCMeta):
+        pass
+
+    class B:
+        pass
+
+    class C:
+        pass
+
+    @overloaded
+    def f(foo):
+        return 1
+
+    @overloads(f)
+    def f(foo: A):
+        return 2
+
+    @overloads(f)
+    def f(foo, bar: int):
+        return 3
+
+    g = f.specialize(B)
+    for _ in range(rounds):
+        assert f(B())    == 1
+        assert f(C())    == 1
+        assert f(B(), 1) == 3
+        assert g(B())    == 1
+    assert len(f._cache) == 3
+    A.register(B)
+    for _ in range(rounds):
+        assert f(B())    == 2
+        assert f(C())    == 1
+        assert f(B(), 1) == 3
+        assert g(B())    == 2
+    assert len(f._cache) == 3
+    assert f.cache_info().misses == 5
+
+
+@requires_typing
+def test_abc_registration_parameters():
+
+    class A(abc.ABC):
+        pass
+
+    class B:
+        pass
+
+    class C:
+        pass
+
+    class D:
+        pass
+
+    T = TypeVar('T', bound=A, covariant=True)
+
+    @overloaded
+    def f(arg: Tuple[A, ...]):
+        return A
+
+    @overloads(f)
+    def f(arg: Tuple[int, ...]):
+        return int
+
+    @overloaded
+    def g(arg: FrozenSet[Union[A, str]]):
+        return A
+
+    @overloads(g)
+    def g(arg: FrozenSet[int]):
+        return int
+
+    @overloaded
+    def h(arg: Tuple[T, int]):
+        return T
+
+    @overloads(h)
+    def h(arg: Tuple[int, int]):
+        return int
+
+    for func in (f, g, h):
+        assert overloading.is_volatile(func)
+
+    with pytest.raises(TypeError):
+        f((B(),))
+    with pytest.raises(TypeError):
+        g(frozenset([C()]))
+    with pytest.raises(TypeError):
+        h((D(), 1))
+
+    A.register(B)
+    A.register(C)
+    A.register(D)
+    for _ in range(rounds):
+        assert f((B(),))           == A
+        assert g(frozenset([C()])) == A
+        assert h((D(), 1))         == T
+
+
+@pytest.mark.skipif(not overloading.legacy_typing, reason="'typing' before Python 3.8 required")
+def test_legacy_typing():
+
+    legacy = overloading.legacy_typing
+
+    for type_ in (legacy.Iterable[int], legacy.Union[int, str], legacy.Tuple[int]):
+        with pytest.raises(OverloadingError):
+            @overloaded
+            def f(foo: type_):
+                pass
+
+    @overloaded
+    def f(foo: legacy.Iterable):
+        return Iterable
+
+    for _ in range(rounds):
+        assert f([1]) == Iterable
+
+
 @requires_typing
 def test_typing_basics():
 
@@ -654,15 +1063,15 @@ def test_typing_tuple():
     def f(arg: Tuple[int, str]):
         return int, str
 
-    assert f.__complex_positions == {}
-    assert f.__complex_parameters == {}
+    assert f._complex_positions == {}
+    assert f._complex_parameters == {}
 
     @overloads(f)
     def f(arg: Tuple[str, int]):
         return str, int
 
-    assert f.__complex_positions == {0: 8}
-    assert f.__complex_parameters == {'arg': 8}
+    assert f._complex_positions == {0: 8}
+    assert f._complex_parameters == {'arg': 8}
 
     for _ in range(rounds):
         assert f((1, b)) == (int, str)
@@ -712,6 +1121,48 @@ def test_typing_tuple():
                 f(())
 
 
+@requires_typing
+def test_typing_tuple_key():
+
+    Record = Tuple[(int,) * 20]
+
+    @overloaded
+    def f(arg: tuple):
+        return tuple
+
+    @overloads(f)
+    def f(arg: Tuple[int, int]):
+        return Tuple[int, int]
+
+    @overloads(f)
+    def f(arg: Record):
+        return Record
+
+    assert f._tuple_lengths == {0: {2, 20}, 'arg': {2, 20}}
+
+    record = tuple(range(20))
+    large = tuple(range(10000))
+    for _ in range(rounds):
+        assert f((1, 2))          == Tuple[int, int]
+        assert f((1, a))          == tuple
+        assert f(record)          == Record
+        assert f(large)           == tuple
+        assert f(large + (a,))    == tuple
+        assert f(arg=large)       == tuple
+    # Tuples of lengths that no `Tuple` declaration has are described alike.
+    assert ((tuple, None),) in f._cache
+    assert f.cache_info().misses == 5
+
+    @overloads(f)
+    def f(arg: Tuple[str, ...]):
+        return Tuple[str, ...]
+
+    for _ in range(rounds):
+        assert f(large)           == tuple
+        assert f((a,) * 10000)    == Tuple[str, ...]
+        assert f((a, a))          == Tuple[str, ...]
+
+
 @requires_typing
 def test_typing_type_var():
 
@@ -726,7 +1177,8 @@ def test_typing_type_var():
     class Bar(Foo[int, str]):
         pass
 
-    @overloaded
+    # Only the first element is inspected, whatever the value of ELEMENT_CHECK.
+    @overloaded(element_check='first')
     def f(arg: Sequence[N]):
         return N
 
@@ -752,6 +1204,30 @@ def test_typing_type_var():
     assert f(Foo()) == Foo
     assert f(Bar()) == Bar
 
+    # An invariant type variable only accepts elements of exactly its bound,
+    # while a covariant one accepts subclasses as well. With every element
+    # inspected, a single element of a subclass rules out the invariant one.
+    L_co = TypeVar('L_co', bound=X, covariant=True)
+
+    @overloaded(element_check='full')
+    def g(arg: Sequence):
+        return Sequence
+
+    @overloads(g)
+    def g(arg: Sequence[L]):
+        return L
+
+    @overloads(g)
+    def g(arg: Tuple[L_co, ...]):
+        return L_co
+
+    for _ in range(rounds):
+        assert g([x, x])    == L
+        assert g([x, y, z]) == Sequence
+        assert g([y])       == Sequence
+        assert g((x, y, z)) == L_co
+        assert g((z,))      == L_co
+
 
 @requires_typing
 def test_typing_parameterized_collections():
@@ -760,57 +1236,57 @@ def test_typing_parameterized_collections():
     def f(_, arg: Iterable[int]):
         return Iterable[int]
 
-    assert f.__complex_positions == {}
-    assert f.__complex_parameters == {}
+    assert f._complex_positions == {}
+    assert f._complex_parameters == {}
 
     @overloads(f)
     def f(_, arg: Iterable[str]):
         return Iterable[str]
 
-    assert f.__complex_positions == {1: 2}
-    assert f.__complex_parameters == {'arg': 2}
+    assert f._complex_positions == {1: 2}
+    assert f._complex_parameters == {'arg': 2}
 
     @overloads(f)
     def f(_, arg: Sequence[int]):
         return Sequence[int]
 
-    assert f.__complex_positions == {1: 2}
-    assert f.__complex_parameters == {'arg': 2}
+    assert f._complex_positions == {1: 2}
+    assert f._complex_parameters == {'arg': 2}
 
     @overloads(f)
     def f(_, x: Sequence[str]):
         return Sequence[str]
 
-    assert f.__complex_positions == {1: 2}
-    assert f.__complex_parameters == {'arg': 2}
+    assert f._complex_positions == {1: 2}
+    assert f._complex_parameters == {'arg': 2}
 
     @overloads(f)
     def f(_, x: Sequence):
         return Sequence
 
-    assert f.__complex_positions == {1: 2|1}
-    assert f.__complex_parameters == {'arg': 2, 'x': 3}
+    assert f._complex_positions == {1: 2|1}
+    assert f._complex_parameters == {'arg': 2, 'x': 3}
 
     @overloads(f)
     def f(_, arg: Mapping[str, int]):
         return Mapping[str, int]
 
-    assert f.__complex_positions == {1: 2|1|4}
-    assert f.__complex_parameters == {'arg': 2|4, 'x': 3}
+    assert f._complex_positions == {1: 2|1|4}
+    assert f._complex_parameters == {'arg': 2|4, 'x': 3}
 
     @overloads(f)
     def f(_, arg: Tuple):
         return Tuple
 
-    assert f.__complex_positions == {1: 2|1|4}
-    assert f.__complex_parameters == {'arg': 2|1|4, 'x': 3}
+    assert f._complex_positions == {1: 2|1|4}
+    assert f._complex_parameters == {'arg': 2|1|4, 'x': 3}
 
     @overloads(f)
     def f(_, arg: Tuple[int, str]):
         return Tuple[int, str]
 
-    assert f.__complex_positions == {1: 2|1|4|8}
-    assert f.__complex_parameters == {'arg': 2|1|4|8, 'x': 3}
+    assert f._complex_positions == {1: 2|1|4|8}
+    assert f._complex_parameters == {'arg': 2|1|4|8, 'x': 3}
 
     for _ in range(rounds):
         assert f(0, {1, 2, 3}) == Iterable[int]
@@ -822,7 +1298,7 @@ def test_typing_parameterized_collections():
         with pytest.raises(TypeError):
             f(0, {1.0: a})
 
-    assert len(f.__cache) == 6
+    assert len(f._cache) == 7
 
     @overloaded
     def f(arg: Iterable[X]):
@@ -847,29 +1323,28 @@ def test_typing_parameterized_collections():
     def f(arg: XIterable):
         return XIterable
 
-    assert f.__complex_positions == {}
-    assert f.__complex_parameters == {}
+    assert f._complex_positions == {}
+    assert f._complex_parameters == {}
 
     @overloads(f)
     def f(arg: Iterable[Y]):
         return Iterable[Y]
 
-    assert f.__complex_positions == {0: 2}
-    assert f.__complex_parameters == {'arg': 2}
+    assert f._complex_positions == {0: 2}
+    assert f._complex_parameters == {'arg': 2}
 
     for _ in range(rounds):
         assert f(XIterable({x, x, x})) == XIterable
         assert f(XIterable({y, y, y})) == XIterable
         assert f(XIterable([z, z, z])) == XIterable
 
-    T = TypeVar('T')
-
+    # A mutable sequence is invariant.
     @overloaded
     def f(arg: Iterable[X]):
         return X
 
     @overloads(f)
-    def f(arg: Iterable[T][Y]):
+    def f(arg: MutableSequence[Y]):
         return Y
 
     @overloads(f)
@@ -883,6 +1358,24 @@ def test_typing_parameterized_collections():
         assert f([])        == Y
         assert f((z, z, z)) == Tuple
 
+    # Keyword calls are keyed by the contents of complex positional arguments
+    # even if the parameter names differ.
+    @overloaded
+    def f(foo: Iterable[int], bar=None):
+        return int
+
+    @overloads(f)
+    def f(baz: Iterable[str], bar=None):
+        return str
+
+    assert f._complex_positions == {0: 2}
+    assert f._complex_parameters == {}
+
+    for _ in range(rounds):
+        assert f([1], bar=1) == int
+        assert f([a], bar=1) == str
+        assert f([a])        == str
+
 
 @requires_typing
 def test_typing_mapping():
@@ -890,7 +1383,6 @@ def test_typing_mapping():
     K = TypeVar('K', covariant=True)
     T = TypeVar('T')
 
-    CovariantKeyDict = Mapping[K, T]
     AnyValueDict = Mapping[int, T]
 
     class MyInt(int): pass
@@ -916,55 +1408,443 @@ def test_typing_mapping():
     def f(arg: AnyValueDict):
         return AnyValueDict
 
-    assert f.__complex_positions == {0: 1|2}
-    assert f.__complex_parameters == {'arg': 1|2}
+    assert f._complex_positions == {0: 1|2}
+    assert f._complex_parameters == {'arg': 1|2}
 
     @overloads(f)
-    def f(arg: CovariantKeyDict[int, str]):
-        return CovariantKeyDict[int, str]
+    def f(arg: Mapping[int, str]):
+        return Mapping[int, str]
 
-    assert f.__complex_positions == {0: 1|2|4}
-    assert f.__complex_parameters == {'arg': 1|2|4}
+    assert f._complex_positions == {0: 1|2|4}
+    assert f._complex_parameters == {'arg': 1|2|4}
 
     for _ in range(rounds):
-        assert f({3: 'hey'})     == CovariantKeyDict[int, str]
-        assert f({3: hello})     == AnyValueDict
-        assert f({three: 'hey'}) == CovariantKeyDict[int, str]
+        assert f({3: 'hey'})     == Mapping[int, str]
+        # The values of a `Mapping` are covariant, but the keys are not.
+        assert f({3: hello})     == Mapping[int, str]
+        assert f({three: 'hey'}) == Mapping
         assert f({3: x})         == AnyValueDict
-        assert f({})             == CovariantKeyDict[int, str]
+        assert f({})             == Mapping[int, str]
         assert f({'hi': 'hey'})  == Mapping
 
-
-@requires_typing
-def test_typing_union():
+    # Mutable containers are invariant, unless declared otherwise.
+    class Table(Dict[K, T]):
+        pass
 
     @overloaded
-    def f(arg: Union[Tuple[int, ...], int]):
-        return 1
+    def f(arg: dict):
+        return dict
 
     @overloads(f)
-    def f(arg: Sequence[int]):
-        return 2
+    def f(arg: Dict[int, str]):
+        return Dict[int, str]
+
+    @overloads(f)
+    def f(arg: Table[int, str]):
+        return Table[int, str]
 
     for _ in range(rounds):
-        assert f((1, 2, 3)) == 1
+        assert f({3: 'hey'})            == Dict[int, str]
+        assert f({3: hello})            == dict
+        assert f(Table({3: 'hey'}))     == Table[int, str]
+        assert f(Table({three: 'hey'})) == Table[int, str]
+        assert f(Table({3: hello}))     == dict
 
-    @overloaded
-    def f(arg: Sequence):
-        return 1
 
-    @overloads(f)
-    def f(arg: Union[Sequence[int], Tuple[int]]):
-        return 2
+@requires_typing
+def test_element_check():
 
-    @overloads(f)
-    def f(arg: Union[Iterable[int], MutableSequence[int]]):
-        return 3
+    def declare(**kwargs):
+
+        @overloaded(**kwargs)
+        def f(arg: Iterable):
+            return Iterable
+
+        @overloads(f)
+        def f(arg: Iterable[int]):
+            return Iterable[int]
+
+        @overloads(f)
+        def f(arg: Mapping[str, int]):
+            return Mapping[str, int]
+
+        @overloads(f)
+        def f(other: Sequence[str], flag=False):
+            return Sequence[str]
+
+        return f
+
+    mixed = [1, 2, 'a']
+    big = list(range(1000))
+
+    f = declare(element_check='first')
+    for _ in range(rounds):
+        assert f(mixed)            == Iterable[int]
+        assert f(arg=mixed)        == Iterable[int]
+        assert f({'a': 1, 'b': b}) == Mapping[str, int]
+
+    f = declare(element_check='full')
+    assert f._position_checks == {0: 'full', 1: 'full'}
+    for _ in range(rounds):
+        assert f(mixed)            == Iterable
+        assert f(arg=mixed)        == Iterable
+        assert f([1, 2, 3])        == Iterable[int]
+        assert f(big)              == Iterable[int]
+        assert f((a, b))           == Sequence[str]
+        assert f([a, 1])           == Iterable
+        assert f({'a': 1, 'b': b}) == Iterable
+        assert f({'a': 1, 'b': 2}) == Mapping[str, int]
+        assert f([])               == Sequence[str]
+    assert f.cache_info().misses == 7
+
+    # A positional argument is checked by the strictest policy among the parameters
+    # at that position, while a keyword argument follows its own. The parameters
+    # left out follow ELEMENT_CHECK.
+    default = overloading.ELEMENT_CHECK
+    overloading.ELEMENT_CHECK = 'first'
+    try:
+        f = declare(element_check={'arg': 'full'})
+    finally:
+        overloading.ELEMENT_CHECK = default
+    assert f._position_checks == {0: 'full'}
+    for _ in range(rounds):
+        assert f(mixed)            == Iterable
+        assert f(arg=mixed)        == Iterable
+        assert f((a, b, 1))        == Iterable
+        assert f(other=(a, b, 1))  == Sequence[str]
+
+    f = declare(element_check=3)
+    for _ in range(rounds):
+        assert f(mixed)            == Iterable
+        assert f([1, 2])           == Iterable[int]
+        assert f(big)              == Iterable[int]
+        assert f({'a': 1, 'b': b}) == Iterable
+    assert overloading.get_item_types(big, False, 3) == (frozenset({int}),)
+    # The same container is always sampled the same way.
+    sample = big + [a]
+    assert overloading.get_item_types(sample, False, 300) == \
+           overloading.get_item_types(sample, False, 300)
+
+    # An iterator is checked by its first element only, rather than drained.
+    for f in declare(element_check='full'), declare(element_check=3):
+        iterator = iter([1] * 10)
+        assert f(iterator) == Iterable[int]
+        assert list(iterator)
+
+    for policy in ('all', 0, -1, True, 1.5):
+        with pytest.raises(OverloadingError):
+            declare(element_check=policy)
+        with pytest.raises(OverloadingError):
+            declare(element_check={'arg': policy})
+
+
+@requires_typing
+def test_reported_element_type():
+
+    class Stream:
+        def __init__(self, type_):
+            self.type = type_
+        def __iter__(self):
+            raise AssertionError("contents accessed")
+        def __overload_element_type__(self):
+            return self.type
+
+    class Table(dict):
+        __overload_element_type__ = (str, int)
+        def __iter__(self):
+            raise AssertionError("contents accessed")
+
+    @overloaded
+    def f(arg: Iterable):
+        return Iterable
+
+    @overloads(f)
+    def f(arg: Iterable[int]):
+        return Iterable[int]
+
+    @overloads(f)
+    def f(arg: Iterable[str]):
+        return Iterable[str]
+
+    @overloads(f)
+    def f(arg: Mapping[str, int]):
+        return Mapping[str, int]
+
+    for _ in range(rounds):
+        assert f(Stream(int))     == Iterable[int]
+        assert f(Stream(bool))    == Iterable[int]
+        assert f(Stream(str))     == Iterable[str]
+        assert f(Stream(float))   == Iterable
+        assert f(arg=Stream(str)) == Iterable[str]
+        assert f(Table())         == Mapping[str, int]
+    assert f.cache_info().misses == 6
+
+    @overloaded(element_check='full')
+    def g(arg: Iterable[int]):
+        return Iterable[int]
+
+    @overloads(g)
+    def g(arg: Iterable[str]):
+        return Iterable[str]
+
+    for _ in range(rounds):
+        assert g(Stream(int)) == Iterable[int]
+        assert g(Stream(str)) == Iterable[str]
+
+
+@requires_typing
+def test_buffer_element_type():
+
+    @overloaded
+    def f(arg: Iterable):
+        return Iterable
+
+    @overloads(f)
+    def f(arg: Iterable[int]):
+        return Iterable[int]
+
+    @overloads(f)
+    def f(arg: Iterable[float]):
+        return Iterable[float]
+
+    doubles = array.array('d', [1.0, 2.0])
+    matrix = memoryview(array.array('i', range(4))).cast('B').cast('i', (2, 2))
+
+    for _ in range(rounds):
+        assert f(b'ab')                     == Iterable[int]
+        assert f(bytearray(b'ab'))          == Iterable[int]
+        assert f(array.array('i', [1]))     == Iterable[int]
+        assert f(doubles)                   == Iterable[float]
+        assert f(memoryview(doubles))       == Iterable[float]
+        assert f(memoryview(b'ab').cast('c'))== Iterable
+        assert overloading.get_reported_type(matrix) is memoryview
+        assert f(matrix)                    == Iterable
+        assert f(memoryview(bytearray(4)).cast('B', (2, 2))) == Iterable
+
+    # Empty buffers are accepted for any element type, like other empty containers.
+    @overloaded
+    def g(arg: Iterable[str]):
+        return str
+
+    empties = [b'', bytearray(), array.array('d'), memoryview(b'')]
+    for _ in range(rounds):
+        for empty in empties:
+            assert overloading.get_reported_type(empty) is None
+            assert g(empty) == str
+
+    numpy = pytest.importorskip('numpy')
+
+    @overloads(f)
+    def f(arg: Iterable[numpy.integer]):
+        return Iterable[numpy.integer]
+
+    @overloads(f)
+    def f(arg: Iterable[numpy.ndarray]):
+        return Iterable[numpy.ndarray]
+
+    for _ in range(rounds):
+        assert f(numpy.zeros(3))                == Iterable[float]
+        assert g(numpy.zeros(0))                == str
+        assert f(numpy.arange(3))               == Iterable[numpy.integer]
+        assert f(numpy.zeros((2, 2)))           == Iterable[numpy.ndarray]
+        assert f(numpy.array(['a']))            == Iterable
+        assert f(numpy.array([1, 'a'], object)) == Iterable[int]
+
+
+@requires_typing
+def test_peek_iterators():
+
+    @overloaded(peek=True)
+    def f(arg: Iterable[int]):
+        return list(arg)
+
+    @overloads(f)
+    def f(arg: Iterable[str]):
+        return str.join('', arg)
+
+    @overloads(f)
+    def f(arg: collections.abc.Generator, flag):
+        return next(arg)
+
+    for _ in range(rounds):
+        assert f(iter([1, 2, 3]))        == [1, 2, 3]
+        assert f(n for n in (1, 2))      == [1, 2]
+        assert f(arg=iter('abc'))        == 'abc'
+        assert f(map(str, (1, 2)))       == '12'
+        assert f([1, 2])                 == [1, 2]
+        assert f((n for n in (4,)), 1)   == 4
+    # A call with an iterator is first resolved without its contents.
+    assert f.cache_info().misses == 10
+
+    # Implementations that don't inspect the contents receive the iterator itself.
+    @overloaded(peek=True)
+    def h(arg: Iterable[str]):
+        return Iterable[str]
+
+    @overloads(h)
+    def h(arg: io.TextIOBase):
+        return arg
+
+    stream = io.StringIO('a\nb\n')
+    for _ in range(rounds):
+        assert h(stream) is stream
+        assert h(iter(['a'])) == Iterable[str]
+    assert stream.readline() == 'a\n'
+
+    @overloaded(peek=True)
+    def k(arg: Iterable[int]):
+        return list(arg)
+
+    @overloads(k)
+    def k(arg: collections.abc.Generator):
+        next(arg)
+        return arg.send(1)
+
+    def echo():
+        value = yield 0
+        while True:
+            value = yield value + 1
+
+    for _ in range(rounds):
+        assert k(echo())       == 2
+        assert k(iter([1, 2])) == [1, 2]
+
+    @overloaded(peek=True)
+    def g(arg: Iterable[int]):
+        return arg
+
+    wrapped = g(iter([1, 2]))
+    assert isinstance(wrapped, overloading.Peekable)
+    assert g(wrapped) is wrapped
+    assert list(wrapped) == [1, 2]
+    assert list(g(iter([]))) == []
+
+
+@requires_typing
+def test_type_nodes():
+
+    T = TypeVar('T')
+    N = TypeVar('N', int, float)
+
+    normalize = overloading.normalize_type
+    IntStrMapping = Mapping[int, str]
+
+    @overloaded
+    def f(arg: IntStrMapping, other: Mapping[int, str]):
+        pass
+
+    @overloaded
+    def g(arg: Mapping[T, str][int], other: Sequence[IntStrMapping]):
+        pass
+
+    f_types = f._functions[0].signature.types
+    g_types = g._functions[0].signature.types
+    assert f_types[0] is f_types[1] is g_types[0] is normalize(IntStrMapping)
+    assert isinstance(f_types[0], overloading.GenericNode)
+    assert f_types[0].type is collections.abc.Mapping
+    assert f_types[0].variances == (0, 1)
+
+    # Nested parameters are reduced to their origin.
+    nested = g_types[1].parameters[0]
+    assert nested is normalize(IntStrMapping, 1) is normalize(IntStrMapping, 2)
+    assert isinstance(nested, overloading.ClassNode)
+    assert nested.type is collections.abc.Mapping
+
+    assert normalize(Any) is normalize(T) is overloading.AnyType
+    assert isinstance(normalize(N), overloading.UnionNode)
+    assert isinstance(normalize(Sequence[N]).parameters[0], overloading.TypeVarNode)
+    assert isinstance(normalize(Tuple[int, ...]), overloading.TupleNode)
+    assert isinstance(normalize(Tuple[Any, ...]), overloading.ClassNode)
+    assert isinstance(normalize(Sequence[Any]), overloading.ClassNode)
+    assert normalize(1) is None
+
+
+@requires_typing
+def test_typing_union():
+
+    @overloaded
+    def f(arg: Union[Tuple[int, ...], int]):
+        return 1
+
+    @overloads(f)
+    def f(arg: Sequence[int]):
+        return 2
+
+    for _ in range(rounds):
+        assert f((1, 2, 3)) == 1
+
+    @overloaded
+    def f(arg: Sequence):
+        return 1
+
+    @overloads(f)
+    def f(arg: Union[Sequence[int], Tuple[int]]):
+        return 2
+
+    @overloads(f)
+    def f(arg: Union[Iterable[int], MutableSequence[int]]):
+        return 3
 
     for _ in range(rounds):
         assert f((1, 2, 3)) == 2
         assert f([1, 2, 3]) == 3
 
+    # Each Union member is registered as a separate alternative.
+    assert [fninfo.func(None) for fninfo in f._functions] == [1, 2, 2, 3, 3]
+    assert not any(isinstance(t, overloading.UnionNode) for _, t in overloading.type_relations)
+
+    @overloaded
+    def f(foo: Union[int, str], bar: Union[X, Number]):
+        return 1
+
+    @overloads(f)
+    def f(foo: Union[int, X], bar: Z):
+        return 2
+
+    assert len(f._functions) == 6
+    for _ in range(rounds):
+        assert f(1, x)   == 1
+        assert f(a, 1.0) == 1
+        assert f(1, z)   == 2
+        assert f(x, z)   == 2
+        with pytest.raises(TypeError):
+            f(x, x)
+
+    # A signature with too many combinations is matched as a whole.
+    U = Union[int, str, X, Sequence[int], Sequence[str]]
+
+    @overloaded
+    def f(foo: U, bar: U):
+        return 1
+
+    @overloads(f)
+    def f(foo: Y, bar: U):
+        return 2
+
+    assert len(f._functions) == 1 + 5
+    assert isinstance(f._functions[0].signature.types[0], overloading.UnionNode)
+    for engine in ('scan', 'net'):
+        f._engine = engine
+        f._net = overloading.DiscriminationNet(f._functions) if engine == 'net' else None
+        for _ in range(rounds):
+            assert f(1, [1]) == 1
+            assert f(y, a)   == 2
+            assert f(z, [a]) == 2
+            assert f(x, z)   == 1
+            with pytest.raises(TypeError):
+                f(1.0, 1)
+            with pytest.raises(TypeError):
+                f(1, [1.0])
+        f.cache_clear()
+
+    # The alternatives of one implementation don't need to be told apart.
+    @overloaded
+    def f(foo: Union[Sequence[int], Sequence[str]]):
+        return 1
+
+    assert len(f._functions) == 2
+    assert f._complex_positions == {}
+
     @overloaded
     def f(arg: Tuple[Union[int, float], int]):
         return 1
@@ -978,6 +1858,35 @@ def test_typing_union():
         assert f((a, 2)) == 2
 
 
+@requires_typing
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="'X | Y' requires Python 3.10")
+def test_builtin_generics():
+
+    @overloaded
+    def f(arg: list[int] | tuple[str, ...]):
+        return 1
+
+    @overloads(f)
+    def f(arg: dict[str, int] | None):
+        return 2
+
+    @overloads(f)
+    def f(arg: list[str]):
+        return 3
+
+    assert len(f._functions) == 5
+    for _ in range(rounds):
+        assert f([1, 2]) == 1
+        assert f((a, b)) == 1
+        assert f({a: 1}) == 2
+        assert f(None)   == 2
+        assert f([a, b]) == 3
+        with pytest.raises(TypeError):
+            f({1: 1})
+        with pytest.raises(TypeError):
+            f((1, 2))
+
+
 def test_named():
 
     @overloaded
@@ -1036,6 +1945,438 @@ def test_hooks():
         test(f, (a, b), ['before', ('any', 'any'), 'after'])
         test(f, (a, 2), ['before', ('any', 'int'), 'after'])
 
+    @overloads(f, 'before')
+    def f(*args, **kwargs):
+        called.append('before 2')
+
+    inner_funcs = set()
+
+    @overloads(f, 'around')
+    def f(func, *args, **kwargs):
+        called.append('around 1')
+        inner_funcs.add(func)
+        return ('around 1', func(*args, **kwargs))
+
+    @overloads(f, 'around')
+    def f(func, *args, **kwargs):
+        called.append('around 2')
+        return ('around 2', func(*args, **kwargs))
+
+    for _ in range(rounds):
+        assert f(a, b) == ('around 1', ('around 2', None))
+        assert called == ['before', 'before 2', 'around 1', 'around 2', ('any', 'any'), 'after']
+        del called[:]
+        assert f(a, 2) == ('around 1', ('around 2', None))
+        assert called == ['before', 'before 2', 'around 1', 'around 2', ('any', 'int'), 'after']
+        del called[:]
+
+    # The chain of around hooks is bound once for each implementation.
+    assert len(inner_funcs) == 2
+
+    with pytest.raises(OverloadingError):
+        @overloads(f, 'during')
+        def f(*args):
+            pass
+
+
+def test_cache_size():
+
+    @overloaded(cache_size=2)
+    def f(foo: int):
+        return int
+
+    @overloads(f)
+    def f(foo: str):
+        return str
+
+    @overloads(f)
+    def f(foo: X):
+        return X
+
+    assert f.cache_info() == (0, 0, 0, 2, 0)
+
+    for _ in range(rounds):
+        assert f(1) == int
+    assert f(a) == str
+    assert f.cache_info() == (rounds - 1, 2, 0, 2, 2)
+
+    assert f(1) == int
+    assert f(x) == X
+    assert f.cache_info() == (rounds, 3, 1, 2, 2)
+    assert list(f._cache) == [(int,), (X,)]
+
+    assert f(a) == str
+    assert f.cache_info() == (rounds, 4, 2, 2, 2)
+    assert list(f._cache) == [(X,), (str,)]
+
+    f.cache_clear()
+    assert f.cache_info() == (0, 0, 0, 2, 0)
+
+    @overloaded
+    def g(foo: int):
+        return int
+
+    for _ in range(rounds):
+        assert g(1) == int
+    assert g.cache_info() == (rounds - 1, 1, 0, None, 1)
+
+
+def test_cache_no_match():
+
+    called = []
+
+    @overloaded
+    def f(foo: int):
+        return int
+
+    @overloads(f, 'before')
+    def f(*args, **kwargs):
+        called.append('before')
+
+    for _ in range(rounds):
+        with pytest.raises(TypeError):
+            f(a)
+        with pytest.raises(TypeError):
+            f(foo=a)
+    assert f.cache_info().misses == 2
+    assert called == []
+
+    @overloads(f)
+    def f(foo: str):
+        return str
+
+    for _ in range(rounds):
+        assert f(a) == str
+        assert f(foo=a) == str
+    assert f.cache_info().misses == 4
+
+
+@requires_typing
+def test_cache_no_match_contents():
+
+    # The contents of the arguments are not part of the cache key when only one
+    # signature declares a parameterized type, so a failure must not be cached.
+    @overloaded
+    def f(arg: Tuple[int, int]):
+        return Tuple[int, int]
+
+    @overloaded
+    def g(arg: Iterable[int], flag=False):
+        return Iterable[int]
+
+    for _ in range(rounds):
+        with pytest.raises(TypeError):
+            f((1, a))
+        with pytest.raises(TypeError):
+            g([a])
+        with pytest.raises(TypeError):
+            g(arg=[a])
+    assert len(f._cache) == len(g._cache) == 0
+    assert f((1, 2))     == Tuple[int, int]
+    assert g([1, 2])     == Iterable[int]
+    assert g(arg=[1, 2]) == Iterable[int]
+
+
+def test_cache_key():
+
+    @overloaded
+    def f(self, foo: int):
+        return int
+
+    @overloads(f)
+    def f(self, foo: str, bar=None):
+        return str
+
+    for obj in (x, y, z):
+        for _ in range(rounds):
+            assert f(obj, 1)     == int
+            assert f(obj, a)     == str
+            assert f(obj, a, b)  == str
+            assert f(obj, foo=1) == int
+
+    assert len(f._cache) == 4
+
+
+def test_cache_invalidation():
+
+    @overloaded
+    def f(foo: int, bar=None):
+        return int
+
+    @overloads(f)
+    def f(foo: str, bar=None):
+        return str
+
+    @overloads(f)
+    def f(foo: X, bar=None):
+        return X
+
+    for _ in range(rounds):
+        assert f(1)        == int
+        assert f(a)        == str
+        assert f(y)        == X
+        assert f(foo=y)    == X
+        assert f(a, bar=1) == str
+    assert f.cache_info().misses == 5
+
+    @overloads(f)
+    def f(foo: Y, bar=None):
+        return Y
+
+    assert len(f._cache) == 3
+    assert f(1) == int
+    assert f(a) == str
+    assert f(a, bar=1) == str
+    assert f.cache_info().misses == 5
+    assert f(y) == Y
+    assert f(foo=y) == Y
+    assert f.cache_info().misses == 7
+
+    @overloads(f)
+    def f(foo: Y, bar: int):
+        return (Y, int)
+
+    assert len(f._cache) == 5
+    class W:
+        pass
+
+    assert f(y, 1) == (Y, int)
+    assert f(x, 1) == X
+    with pytest.raises(TypeError):
+        f(W(), 1)
+    assert len(f._cache) == 8
+
+    @overloads(f)
+    def f(foo: collections.abc.Iterable, bar: int):
+        return (collections.abc.Iterable, int)
+
+    assert len(f._cache) == 7
+    assert f.cache_info().misses == 10
+    assert f((), 1) == (collections.abc.Iterable, int)
+
+    collections.abc.Iterable.register(W)
+    assert f(W(), 1) == (collections.abc.Iterable, int)
+    assert f(x, 1) == X
+
+
+def test_cache_invalidation_no_args():
+
+    @overloaded
+    def f(foo: int = 1):
+        return int
+
+    @overloads(f)
+    def f(foo: str = '', *args):
+        return str
+
+    assert f() == int
+    assert () in f._cache
+
+    @overloads(f)
+    def f(foo: X):
+        return X
+
+    assert () in f._cache
+    assert f(x) == X
+
+
+def test_direct_call():
+
+    @overloaded
+    def f(foo):
+        return 1
+
+    @overloads(f)
+    def f(foo, bar, *args):
+        return 2
+
+    for _ in range(rounds):
+        assert f(a)       == 1
+        assert f(a, b)    == 2
+        assert f(a, b, c) == 2
+        with pytest.raises(TypeError):
+            f()
+
+    assert len(f._cache) == 1
+    assert f.cache_info().hits == rounds - 1
+
+    @overloads(f)
+    def f(foo: int):
+        return 3
+
+    for _ in range(rounds):
+        assert f(a)       == 1
+        assert f(1)       == 3
+        assert f(a, b)    == 2
+
+    assert len(f._cache) == 2
+
+
+def test_specialize():
+
+    @overloaded
+    def f(foo, bar=None):
+        return 1
+
+    @overloads(f)
+    def f(foo: int, bar: str = None):
+        return 2
+
+    g = f.specialize(int, str)
+    assert f.specialize(int, str) is g
+    for _ in range(rounds):
+        assert g(1, 'x') == 2
+        assert g(a, b)   == 1
+        assert g(True, 'x') == 2
+    assert f.cache_info().hits + f.cache_info().misses == rounds * 2
+
+    h = f.specialize(int, bar=type(None))
+    assert h(1, bar=None) == 2
+    assert h(1)           == 2
+
+    @overloads(f)
+    def f(foo: int, bar: str):
+        return 3
+
+    assert g(1, 'x') == 3
+    assert h(1, bar=None) == 2
+
+    with pytest.raises(TypeError):
+        f.specialize()
+
+    if typing:
+        @overloads(f)
+        def f(foo: Iterable[int]):
+            return 4
+
+        with pytest.raises(OverloadingError):
+            f.specialize(list)
+        # Only implementations accepting two arguments are relevant to these.
+        hits = f.cache_info().hits
+        assert g(1, 'x') == 3
+        assert f.specialize(list, str)([], 'x') == 1
+        assert f.cache_info().hits == hits
+
+        # A parameterized type that the argument type rules out is no obstacle.
+        @overloaded
+        def k(foo: int):
+            return int
+
+        spec = k.specialize(int)
+
+        @overloads(k)
+        def k(foo: Sequence[int]):
+            return Sequence[int]
+
+        info = k.cache_info()
+        assert spec(1) == int
+        assert k.specialize(foo=int)(foo=1) == int
+        assert k.cache_info() == info
+        with pytest.raises(OverloadingError):
+            k.specialize(list)
+
+
+def test_dispatcher_object():
+
+    @overloaded
+    def f(foo):
+        """Docstring"""
+        return foo
+
+    assert f.__name__ == 'f'
+    assert 'Docstring' in f.__doc__
+    assert repr(f).startswith('<overloaded function ')
+    assert f.__module__ == __name__
+    assert f.__qualname__ == 'test_dispatcher_object.<locals>.f'
+    assert overloading.Dispatcher.__module__ == 'overloading'
+    assert 'overloaded function' in overloading.Dispatcher.__doc__
+    f.attr = 1
+    assert f.attr == 1
+
+    @wraps(f)
+    def g(*args):
+        return f(*args) + 1
+
+    assert g.__name__ == 'f'
+    assert g.__wrapped__ is f
+    assert g(1) == 2
+
+
+def test_shared_code():
+
+    def make():
+
+        @overloaded
+        def f(foo: int):
+            return int
+
+        @overloads(f)
+        def f(foo: str):
+            return str
+
+        return f
+
+    f, g = make(), make()
+    assert f(1) == g(1) == int
+    assert f.__call__ is not g.__call__
+    assert f.__call__.__code__ is g.__call__.__code__
+    assert f._hooks is None
+    assert f._namespace['no_match'] is None
+    with pytest.raises(TypeError):
+        f(1.0)
+    assert f._namespace['no_match'] is not g._namespace['no_match']
+
+
+def test_abstract_method():
+
+    class A(metaclass=abc.ABCMeta):
+
+        @abc.abstractmethod
+        @overloaded
+        def f(self, foo: int):
+            return int
+
+        @overloads(f)
+        def f(self, foo: str):
+            return str
+
+    class B(A):
+
+        def f(self, foo):
+            return A.f(self, foo)
+
+    assert A.f.__isabstractmethod__
+    assert A.__abstractmethods__ == {'f'}
+    with pytest.raises(TypeError):
+        A()
+    assert B().f(1) == int
+    assert B().f('a') == str
+
+
+@min33
+def test_dispatcher_protocols():
+
+    import _test_basics
+
+    f = _test_basics.f
+    assert pickle.loads(pickle.dumps(f)) is f
+
+    import _test_classes
+
+    method = _test_classes.C.f
+    assert pickle.loads(pickle.dumps(method)) is method
+    assert pickle.loads(pickle.dumps(method.__wrapped__)) is method.__wrapped__
+    assert copy.copy(f) is f
+    assert copy.deepcopy([f])[0] is f
+    assert str(inspect.signature(f)) == '(*args, **kwargs)'
+
+    class C:
+        @overloaded
+        def f(self, foo):
+            return foo
+
+    assert str(inspect.signature(C.f)) == '(*args, **kwargs)'
+
 
 @min33
 def test_classes():
@@ -1043,6 +2384,36 @@ def test_classes():
     import _test_classes
 
 
+def test_method_function():
+
+    class C:
+
+        @overloaded
+        def f(self, foo):
+            return 1
+
+        @overloads(f)
+        def f(self, foo: int):
+            return 2
+
+    assert type(C.__dict__['f']) is type(test_method_function)
+    inst = C()
+    for _ in range(rounds):
+        assert inst.f(a) == 1
+        assert inst.f(1) == 2
+    assert C.f.cache_info().currsize == 2
+
+    class S(C):
+
+        @overloads(C.f)
+        def f(self, foo, bar):
+            return 3
+
+    assert S.__dict__['f'] is C.__dict__['f']
+    assert inst.f(a, b) == 3
+    assert S().f(1) == 2
+
+
 @min33
 def test_classmethods():
 
@@ -1177,13 +2548,15 @@ def test_decorated_2():
 
 def test_void_implementation():
 
-    doc = \
+    # Taken from a docstring, as Python 3.13 and later strip the indentation of docstrings.
+    def doc():
         """f(a, b, x: int, y: float)
 
         Just
         a
         docstring
         """
+    doc = doc.__doc__
 
     @overloaded
     def f(a, b, x : int, y : float):
@@ -1222,9 +2595,9 @@ def test_void_implementation():
 
     assert h.__doc__ == 'h(...)\n\n'
 
-    assert len(f.__functions) == 0
-    assert len(g.__functions) == 0
-    assert len(h.__functions) == 0
+    assert len(f._functions) == 0
+    assert len(g._functions) == 0
+    assert len(h._functions) == 0
 
 
 def test_errors():